@@ -0,0 +1,83 @@
+"""Throughput and latency by client concurrency: gunicorn threads against asyncio.
+
+    python -m benchmarks.concurrency --threads 4 --clients 4 16 64 256 --seconds 10
+
+Both servers run one process on the same seeded file database, gunicorn
+with --threads threads and uvicorn with the async application. For each
+concurrency level that many clients send the read mix of benchmarks.server
+as fast as they can, over keep-alive connections. Requests that fail or
+time out are counted as errors.
+"""
+import argparse, asyncio, random, statistics, subprocess, sys, time
+
+import httpx
+
+from .server import directory, seed, paths, wait_until_up
+
+
+async def load(url, clients, seconds, timeout):
+    deadline = time.monotonic() + seconds
+    times, errors = list(), 0
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=timeout) as session:
+        async def client():
+            nonlocal errors
+
+            for path in paths():
+                if time.monotonic() > deadline:
+                    return
+
+                start = time.perf_counter()
+
+                try:
+                    (await session.get(path)).raise_for_status()
+                    times.append((time.perf_counter() - start) * 1000)
+                except httpx.HTTPError:
+                    errors += 1
+
+        await asyncio.gather(*(client() for _ in range(clients)))
+
+    return len(times) / seconds, statistics.quantiles(times, n=100) if len(times) > 1 else [0] * 99, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--clients', type=int, nargs='+', default=[4, 16, 64, 256])
+    parser.add_argument('--seconds', type=int, default=10)
+    parser.add_argument('--timeout', type=float, default=10)
+    args = parser.parse_args()
+    random.seed(0)
+    seed()
+
+    servers = {
+        f"gunicorn 1x{args.threads}": ([
+            sys.executable, '-m', 'library', 'serve', '--bind', '127.0.0.1:5001',
+            '--workers', '1', '--threads', str(args.threads)
+        ], "http://127.0.0.1:5001"),
+        'uvicorn async': ([
+            sys.executable, '-m', 'library', 'serve-async', '--bind', '127.0.0.1:5002', '--workers', '1'
+        ], "http://127.0.0.1:5002"),
+    }
+
+    print(f"{'server':<16}{'clients':>8}{'req/s':>9}{'p50 ms':>9}{'p99 ms':>9}{'errors':>8}")
+
+    for name, (command, url) in servers.items():
+        process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+        try:
+            wait_until_up(url)
+
+            for clients in args.clients:
+                rate, percentiles, errors = asyncio.run(load(url, clients, args.seconds, args.timeout))
+                print(f"{name:<16}{clients:>8}{rate:>9.0f}{percentiles[49]:>9.1f}{percentiles[98]:>9.1f}{errors:>8}")
+        finally:
+            process.terminate()
+            process.wait()
+
+    directory.cleanup()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""Seeded synthetic library datasets written straight into the tables.
+
+    python -m benchmarks.dataset --size 100000 --output library-100000.db
+
+A dataset of size N holds N books, N / 2 authors, N / 10 clients and about
+two authors per book, with every other book lent to a client. The same size
+and seed always produce the same rows.
+"""
+import argparse, os, random, time
+from datetime import date, timedelta
+
+from sqlalchemy import create_engine, event
+
+from library.models import database, utcnow
+
+SYLLABLES = (
+    'ka', 'lo', 'mi', 're', 'sa', 'to', 'vi', 'na', 'del', 'mar', 'ten', 'ro', 'ba', 'zu', 'fen', 'li',
+    'gor', 'an', 'el', 'is', 'ur', 'ca', 'pe', 'dri', 'mon', 'sel', 'var', 'qu', 'ha', 'jo', 'wen', 'ty'
+)
+
+# Rows sent per executemany
+CHUNK = 20000
+
+
+def word(rng, syllables=(2, 4)):
+    return ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(*syllables))).capitalize()
+
+
+def rows(size, seed):
+    rng = random.Random(seed)
+    now = utcnow()
+    authors = max(size // 2, 1)
+    clients = max(size // 10, 1)
+
+    # The index suffix keeps names and titles unique, as the schema requires
+    people = lambda count: [
+        {'id': i + 1, 'first_name': word(rng), 'last_name': f"{word(rng)}{i}", 'updated_at': now}
+        for i in range(count)
+    ]
+    tables = {'author': people(authors), 'client': people(clients)}
+
+    for author in tables['author']:
+        birth = date(1850, 1, 1) + timedelta(days=rng.randrange(150 * 365))
+        author['birth'] = birth
+        author['death'] = birth + timedelta(days=rng.randrange(30 * 365, 90 * 365)) if rng.random() < 0.6 else None
+
+    names = {author['id']: f"{author['first_name']} {author['last_name']}" for author in tables['author']}
+    books, links = list(), list()
+
+    for i in range(size):
+        book_authors = sorted(rng.sample(range(1, authors + 1), min(authors, rng.choice((1, 1, 2, 2, 3)))))
+        links.extend({'book_id': i + 1, 'author_id': author_id} for author_id in book_authors)
+        books.append({
+            'id': i + 1,
+            'title': f"{word(rng)} {word(rng, (1, 3)).lower()} {i}",
+            'premiere': date(1900, 1, 1) + timedelta(days=rng.randrange(125 * 365)),
+            'price': round(rng.uniform(5, 150), 2),
+            'client_id': rng.randrange(1, clients + 1) if i % 2 else None,
+            'authors_summary': [{'name': names[author_id], 'id': author_id} for author_id in book_authors],
+            'updated_at': now,
+        })
+
+    tables['book'] = books
+    tables['books_authors'] = links
+    tables['table_version'] = [
+        {'name': name, 'version': 1, 'updated_at': now} for name in ('books', 'authors', 'clients')
+    ]
+
+    return tables
+
+
+def generate(path, size, seed=0):
+    engine = create_engine('sqlite:///' + path)
+
+    # Nothing to recover from while seeding, the file is thrown away on failure
+    @event.listens_for(engine, 'connect')
+    def fast_writes(connection, record):
+        connection.execute("PRAGMA journal_mode = OFF")
+        connection.execute("PRAGMA synchronous = OFF")
+
+    database.metadata.create_all(engine)
+
+    with engine.begin() as connection:
+        for name, table_rows in rows(size, seed).items():
+            table = database.metadata.tables[name]
+
+            for start in range(0, len(table_rows), CHUNK):
+                connection.execute(table.insert(), table_rows[start:start + CHUNK])
+
+    engine.dispose()
+
+
+def dataset(directory, size, seed=0):
+    # Datasets are generated once per size and seed and reused afterwards
+    path = os.path.join(directory, f"library-{size}-{seed}.db")
+
+    if not os.path.exists(path):
+        try:
+            generate(path, size, seed)
+        except BaseException:
+            os.remove(path)
+            raise
+
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', required=True)
+    args = parser.parse_args()
+
+    if os.path.exists(args.output):
+        parser.error(f"{args.output} already exists")
+
+    start = time.perf_counter()
+    generate(args.output, args.size, args.seed)
+    print(f"{args.size} books written to {args.output} in {time.perf_counter() - start:.1f} s")
+
+
+if __name__ == '__main__':
+    main()
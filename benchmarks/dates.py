@@ -0,0 +1,78 @@
+"""Date parsing and encoding: strptime and HTTP dates against the ISO codec.
+
+    python -m benchmarks.dates --values 100000 --books 5000
+
+The first rows time the date handling alone: the former add_value_from_form
+path (strptime into a datetime) and the former JSON output (HTTP dates)
+against library.dates. The last row imports --books books with a premiere
+through POST /books/bulk and lists them back with the current code.
+"""
+import argparse, os, random, tempfile, time, timeit
+from datetime import date, datetime, timedelta
+
+directory = tempfile.TemporaryDirectory()
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(directory.name, 'bench.db')
+
+from flask.json.provider import DefaultJSONProvider
+
+from library import app
+from library.dates import parse_date, JSONProvider
+from library.models import database
+
+
+def strptime_date(value):
+    return datetime.strptime(value, '%Y-%m-%d')
+
+
+def best(function, repeat=5):
+    return min(timeit.repeat(function, number=1, repeat=repeat))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--values', type=int, default=100000)
+    parser.add_argument('--books', type=int, default=5000)
+    args = parser.parse_args()
+    rng = random.Random(0)
+
+    dates = [date(1900, 1, 1) + timedelta(days=rng.randrange(45000)) for _ in range(args.values)]
+    texts = [value.isoformat() for value in dates]
+    payloads = [{'id': i, 'premiere': value, 'birth': value, 'death': None} for i, value in enumerate(dates)]
+
+    print(f"{'operation':<34}{'before ms':>11}{'after ms':>10}{'speedup':>9}")
+
+    for name, before, after in (
+        (f"parse {args.values} dates", lambda: [strptime_date(text) for text in texts], lambda: [parse_date(text) for text in texts]),
+        (f"encode {args.values} payloads", lambda: DefaultJSONProvider(app).dumps(payloads), lambda: JSONProvider(app).dumps(payloads)),
+    ):
+        before, after = best(before) * 1000, best(after) * 1000
+        print(f"{name:<34}{before:>11.1f}{after:>10.1f}{before / after:>8.1f}x")
+
+    books = [
+        {'title': f"Book {i}", 'premiere': texts[i % len(texts)], 'price': 10.0}
+        for i in range(args.books)
+    ]
+
+    with app.app_context():
+        database.create_all()
+        client = app.test_client()
+
+        start = time.perf_counter()
+        response = client.post("/books/bulk", json=books)
+        imported = (time.perf_counter() - start) * 1000
+        assert response.json['added'] == args.books
+
+        start = time.perf_counter()
+        client.get("/books").get_data()
+        listed = (time.perf_counter() - start) * 1000
+
+        database.session.remove()
+        database.engine.dispose()
+
+    print(f"{f'bulk import {args.books} books':<34}{'':>11}{imported:>10.1f}")
+    print(f"{f'GET /books {args.books} books':<34}{'':>11}{listed:>10.1f}")
+    directory.cleanup()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,186 @@
+"""Latency and throughput of every endpoint on seeded datasets.
+
+    python -m benchmarks.endpoints --sizes 10000 100000 1000000 --output results.json
+    python -m benchmarks.endpoints --sizes 10000 --compare results.json
+
+Every size is served from a copy of its seeded dataset, kept in --data-dir
+between runs. Requests go through the WSGI app in process, so the numbers
+leave out the HTTP server. Endpoints that return a whole collection run
+--heavy-requests times, the others --requests times, and the "delete all"
+endpoints run once at the end. Results are written as JSON, --compare
+prints the change of the median latency against an earlier result file.
+"""
+import argparse, json, os, platform, random, shutil, statistics, subprocess, tempfile, time
+
+directory = tempfile.TemporaryDirectory()
+DATABASE = os.path.join(directory.name, 'bench.db')
+os.environ['DATABASE_URL'] = 'sqlite:///' + DATABASE
+
+from library import app
+from library.cache import cache, name_index
+from library.models import database
+
+from .dataset import dataset
+
+BOOK = lambda rng, i: {
+    'title': f"Bench book {i}", 'price': round(rng.uniform(5, 150), 2), 'premiere': '2001-02-03',
+    'authors': [f"Bench Author{rng.randrange(50)}", f"Bench Writer{i}"], 'client': f"Bench Client{rng.randrange(50)}"
+}
+
+# name: (method, url, body, heavy), url and body are built from the random
+# generator, the dataset size and the request number
+CASES = {
+    'GET /books': ('get', lambda rng, n, i: "/books", None, True),
+    'GET /books?limit': ('get', lambda rng, n, i: f"/books?limit=100&after_id={rng.randrange(n)}", None, False),
+    'GET /books?fields': ('get', lambda rng, n, i: f"/books?fields=title&limit=100&after_id={rng.randrange(n)}", None, False),
+    'GET /books?filter': ('get', lambda rng, n, i: f"/books?price_min={rng.randrange(5, 150)}&price_max={rng.randrange(150, 155)}&sort=-price", None, True),
+    'GET /books?author_id': ('get', lambda rng, n, i: f"/books?author_id={rng.randrange(1, n // 2 + 1)}", None, False),
+    'GET /books ndjson': ('get', lambda rng, n, i: f"/books?format=ndjson&limit=1000&after_id={rng.randrange(n)}", None, False),
+    'GET /books/<id>': ('get', lambda rng, n, i: f"/books/{rng.randrange(1, n + 1)}", None, False),
+    'GET /authors': ('get', lambda rng, n, i: "/authors", None, True),
+    'GET /authors?limit': ('get', lambda rng, n, i: f"/authors?limit=100&after_id={rng.randrange(n // 2)}", None, False),
+    'GET /authors/<id>': ('get', lambda rng, n, i: f"/authors/{rng.randrange(1, n // 2 + 1)}", None, False),
+    'GET /clients': ('get', lambda rng, n, i: "/clients", None, True),
+    'GET /clients?limit': ('get', lambda rng, n, i: f"/clients?limit=100&after_id={rng.randrange(n // 10)}", None, False),
+    'GET /clients/<id>': ('get', lambda rng, n, i: f"/clients/{rng.randrange(1, n // 10 + 1)}", None, False),
+    'GET /search': ('get', lambda rng, n, i: f"/search?q={rng.choice(('ka', 'mar', 'lo', 'ten', 'vi'))}", None, False),
+    'GET /cache': ('get', lambda rng, n, i: "/cache", None, False),
+    'GET /metrics': ('get', lambda rng, n, i: "/metrics", None, False),
+    'POST /books': ('post', lambda rng, n, i: "/books", BOOK, False),
+    'POST /books/bulk': ('post', lambda rng, n, i: "/books/bulk", lambda rng, i: [BOOK(rng, f"{i} {j}") for j in range(100)], False),
+    'PUT /books/<id>': ('put', lambda rng, n, i: f"/books/{rng.randrange(1, n + 1)}", lambda rng, i: {'price': i}, False),
+    'POST /authors': ('post', lambda rng, n, i: "/authors", lambda rng, i: {
+        'first_name': 'Bench', 'last_name': f"Author {i}", 'books': [f"Bench book {i}", f"Bench novel {i}"]
+    }, False),
+    'PUT /authors/<id>': ('put', lambda rng, n, i: f"/authors/{rng.randrange(1, n // 2 + 1)}", lambda rng, i: {'birth': '1950-01-01'}, False),
+    'POST /clients': ('post', lambda rng, n, i: "/clients", lambda rng, i: {
+        'first_name': 'Bench', 'last_name': f"Client {i}", 'books': [f"Bench loan {i}"]
+    }, False),
+    'PUT /clients/<id>': ('put', lambda rng, n, i: f"/clients/{rng.randrange(1, n // 10 + 1)}", lambda rng, i: {'first_name': f"Renamed{i}"}, False),
+    'DELETE /books/<id>': ('delete', lambda rng, n, i: f"/books/{n - i}", None, False),
+    'DELETE /authors/<id>': ('delete', lambda rng, n, i: f"/authors/{n // 2 - i}", None, False),
+    'DELETE /clients/<id>': ('delete', lambda rng, n, i: f"/clients/{n // 10 - i}", None, False),
+}
+
+# Run once, in this order, after everything else
+DELETE_ALL = ('/clients', '/authors', '/books')
+
+
+def statements(response):
+    timing = response.headers.get('Server-Timing', '')
+    return int(timing.split('desc="')[1].split(' ')[0]) if 'desc="' in timing else 0
+
+
+def summary(size, name, times, counts, elapsed):
+    times = sorted(times)
+    percentile = lambda p: times[min(len(times) - 1, int(p / 100 * len(times)))]
+
+    return {
+        'size': size, 'endpoint': name, 'requests': len(times),
+        'mean_ms': round(statistics.mean(times), 3), 'p50_ms': round(percentile(50), 3),
+        'p95_ms': round(percentile(95), 3), 'p99_ms': round(percentile(99), 3), 'max_ms': round(times[-1], 3),
+        'requests_per_s': round(len(times) / elapsed, 1), 'statements': round(statistics.mean(counts), 2),
+    }
+
+
+def run(client, size, name, method, url, body, count, rng):
+    times, counts = list(), list()
+    start = time.perf_counter()
+
+    for i in range(count):
+        kwargs = {'json': body(rng, i)} if body else {}
+        sent = time.perf_counter()
+        response = getattr(client, method)(url(rng, size, i), **kwargs)
+        response.get_data()
+        times.append((time.perf_counter() - sent) * 1000)
+        counts.append(statements(response))
+
+        if response.status_code >= 500:
+            raise RuntimeError(f"{name} answered {response.status_code}")
+
+    return summary(size, name, times, counts, time.perf_counter() - start)
+
+
+def measure(size, args):
+    shutil.copy(dataset(args.data_dir, size, args.seed), DATABASE)
+    cache.clear()
+    name_index.clear()
+    rng = random.Random(args.seed)
+    results = list()
+
+    with app.app_context():
+        client = app.test_client()
+
+        for name, (method, url, body, heavy) in CASES.items():
+            count = args.heavy_requests if heavy else args.requests
+            results.append(run(client, size, name, method, url, body, min(count, size // 10), rng))
+            print_result(results[-1])
+
+        for url in DELETE_ALL:
+            results.append(run(client, size, f"DELETE {url}", 'delete', lambda *_: url, None, 1, rng))
+            print_result(results[-1])
+
+        database.session.remove()
+        database.engine.dispose()
+
+    return results
+
+
+def print_result(result, baseline=None):
+    change = ''
+
+    if baseline:
+        change = f"{(result['p50_ms'] / baseline['p50_ms'] - 1) * 100:>+9.1f}%" if baseline['p50_ms'] else ''
+
+    print(
+        f"{result['size']:>8} {result['endpoint']:<22}{result['requests']:>6}{result['p50_ms']:>10.2f}"
+        f"{result['p95_ms']:>10.2f}{result['p99_ms']:>10.2f}{result['requests_per_s']:>10.1f}"
+        f"{result['statements']:>7.1f}{change}"
+    )
+
+
+def commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--heavy-requests', type=int, default=5)
+    parser.add_argument('--data-dir', default=os.path.join(tempfile.gettempdir(), 'library-benchmarks'))
+    parser.add_argument('--output', help="Write the results to this JSON file.")
+    parser.add_argument('--compare', help="JSON results of an earlier run to compare with.")
+    args = parser.parse_args()
+    os.makedirs(args.data_dir, exist_ok=True)
+
+    print(f"{'size':>8} {'endpoint':<22}{'count':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'req/s':>10}{'sql':>7}")
+    results = [result for size in args.sizes for result in measure(size, args)]
+
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = {(result['size'], result['endpoint']): result for result in json.load(file)['results']}
+
+        print(f"\nChange of p50 against {args.compare}")
+
+        for result in results:
+            if (result['size'], result['endpoint']) in baseline:
+                print_result(result, baseline[(result['size'], result['endpoint'])])
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump({
+                'commit': commit(), 'python': platform.python_version(), 'platform': platform.platform(),
+                'seed': args.seed, 'requests': args.requests, 'heavy_requests': args.heavy_requests,
+                'results': results,
+            }, file, indent=2)
+
+    directory.cleanup()
+
+
+if __name__ == '__main__':
+    main()
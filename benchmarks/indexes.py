@@ -0,0 +1,111 @@
+"""Lookup cost of the write-path queries with and without the lookup indexes.
+
+    python -m benchmarks.indexes --sizes 1000 10000 100000
+
+For every table size the same queries run against the indexed schema and
+against the schema of the initial migration. Without indexes the time per
+lookup grows with the table (full scan), with them it stays nearly flat
+(B-tree search).
+"""
+import argparse, os, random, tempfile, time
+
+from sqlalchemy import create_engine, text
+
+from library.models import database
+
+QUERIES = {
+    'author by name': (
+        "SELECT id FROM author WHERE first_name = :first_name AND last_name = :last_name",
+        lambda n: {'first_name': f"First{random.randrange(n)}", 'last_name': f"Last{random.randrange(n)}"}
+    ),
+    'client by name': (
+        "SELECT id FROM client WHERE first_name = :first_name AND last_name = :last_name",
+        lambda n: {'first_name': f"First{random.randrange(n)}", 'last_name': f"Last{random.randrange(n)}"}
+    ),
+    'book by title': (
+        "SELECT id FROM book WHERE title = :title",
+        lambda n: {'title': f"Title {random.randrange(n)}"}
+    ),
+    'books of client': (
+        "SELECT id FROM book WHERE client_id = :id",
+        lambda n: {'id': random.randrange(1, n + 1)}
+    ),
+    'books of author': (
+        "SELECT book_id FROM books_authors WHERE author_id = :id",
+        lambda n: {'id': random.randrange(1, n + 1)}
+    ),
+}
+
+UNINDEXED = [
+    "DROP INDEX ix_author_name",
+    "DROP INDEX ix_client_name",
+    "DROP INDEX ix_book_title",
+    "DROP INDEX ix_book_client_id",
+    "DROP INDEX ix_books_authors_author_id",
+    "ALTER TABLE books_authors RENAME TO books_authors_pk",
+    "CREATE TABLE books_authors (book_id INTEGER, author_id INTEGER)",
+    "INSERT INTO books_authors SELECT book_id, author_id FROM books_authors_pk",
+    "DROP TABLE books_authors_pk",
+]
+
+
+def seed(engine, size):
+    people = [{'id': i + 1, 'first_name': f"First{i}", 'last_name': f"Last{i}"} for i in range(size)]
+    books = [{'id': i + 1, 'title': f"Title {i}", 'client_id': random.randrange(1, size + 1)} for i in range(size)]
+    links = {(i + 1, random.randrange(1, size + 1)) for i in range(size) for _ in range(2)}
+
+    with engine.begin() as connection:
+        connection.execute(database.metadata.tables['author'].insert(), people)
+        connection.execute(database.metadata.tables['client'].insert(), people)
+        connection.execute(database.metadata.tables['book'].insert(), books)
+        connection.execute(
+            database.metadata.tables['books_authors'].insert(),
+            [{'book_id': book_id, 'author_id': author_id} for book_id, author_id in links]
+        )
+
+
+def measure(engine, size, repeat):
+    results = dict()
+
+    with engine.connect() as connection:
+        for name, (sql, params) in QUERIES.items():
+            plan = connection.execute(text("EXPLAIN QUERY PLAN " + sql), params(size)).fetchall()
+            start = time.perf_counter()
+
+            for _ in range(repeat):
+                connection.execute(text(sql), params(size)).fetchall()
+
+            results[name] = ((time.perf_counter() - start) / repeat * 1e6, plan[-1][-1])
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+    random.seed(0)
+
+    print(f"{'query':<18}{'rows':>9}{'scan us':>11}{'index us':>11}  plan with index")
+
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            engine = create_engine('sqlite:///' + os.path.join(directory, 'bench.db'))
+            database.metadata.create_all(engine)
+            seed(engine, size)
+            indexed = measure(engine, size, args.repeat)
+
+            with engine.begin() as connection:
+                for statement in UNINDEXED:
+                    connection.execute(text(statement))
+
+            scanned = measure(engine, size, args.repeat)
+            engine.dispose()
+
+        for name in QUERIES:
+            print(f"{name:<18}{size:>9}{scanned[name][0]:>11.1f}{indexed[name][0]:>11.1f}  {indexed[name][1]}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""Peak memory and time per row of a whole book listing, by read path.
+
+    python -m benchmarks.listing --size 100000
+
+The listing is read from a seeded dataset, kept in --data-dir between runs.
+Each path reads and encodes every book: "orm" hydrates mapped objects as
+Book.query.all() did, "rows" reads all the column tuples at once and
+"batches" is the current path, tuples fetched --batch-size at a time from
+one cursor. Memory is the tracemalloc peak, so it counts Python objects only.
+"""
+import argparse, os, shutil, tempfile, time, tracemalloc
+
+directory = tempfile.TemporaryDirectory()
+DATABASE = os.path.join(directory.name, 'bench.db')
+os.environ['DATABASE_URL'] = 'sqlite:///' + DATABASE
+
+from library import app
+from library.models import Book, database
+from library.serializers import FIELDS, select_rows, encode_rows, encode_list, encode_batches
+
+from .dataset import dataset
+
+
+def orm(batch_size):
+    books = Book.query.all()
+    items = [{
+        'id': book.id, 'title': book.title, 'premiere': book.premiere, 'price': book.price,
+        'authors': book.authors_summary or [], 'client_id': book.client_id,
+    } for book in books]
+
+    return app.json.dumps(items)
+
+
+def rows(batch_size):
+    return encode_list(encode_rows('books', select_rows('books', Book.query, FIELDS['books']), FIELDS['books']))
+
+
+def batches(batch_size):
+    return ['['] + list(encode_batches('books', Book.query, FIELDS['books'], batch_size)) + [']']
+
+
+def measure(path, batch_size):
+    # Timed apart from the traced run, tracemalloc slows every allocation
+    database.session.remove()
+    start = time.perf_counter()
+    path(batch_size)
+    elapsed = time.perf_counter() - start
+
+    database.session.remove()
+    tracemalloc.start()
+    path(batch_size)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--data-dir', default=os.path.join(tempfile.gettempdir(), 'library-benchmarks'))
+    args = parser.parse_args()
+    os.makedirs(args.data_dir, exist_ok=True)
+    shutil.copy(dataset(args.data_dir, args.size, args.seed), DATABASE)
+
+    print(f"{'path':<10}{'seconds':>9}{'us/row':>9}{'peak MB':>10}")
+
+    with app.app_context():
+        for name, path in (('orm', orm), ('rows', rows), ('batches', batches)):
+            elapsed, peak = measure(path, args.batch_size)
+            print(f"{name:<10}{elapsed:>9.2f}{elapsed / args.size * 1e6:>9.2f}{peak / 1e6:>10.1f}")
+
+        database.session.remove()
+        database.engine.dispose()
+
+    directory.cleanup()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""Requests per second of the development server against gunicorn.
+
+    python -m benchmarks.server --workers 4 --threads 4 --clients 16 --seconds 10
+
+Both servers run the same app on the same seeded file database. A pool of
+client threads sends a mix of list and by-id requests as fast as it can;
+the table shows throughput and latency percentiles per server.
+"""
+import argparse, os, random, statistics, subprocess, sys, tempfile, time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.request import urlopen
+
+directory = tempfile.TemporaryDirectory()
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(directory.name, 'bench.db')
+
+from library import app
+from library.models import database
+
+BOOKS = 2000
+
+
+def seed():
+    with app.app_context():
+        database.create_all()
+        database.session.execute(database.metadata.tables['client'].insert(), [
+            {'id': i + 1, 'first_name': f"First{i}", 'last_name': f"Last{i}"} for i in range(BOOKS // 10)
+        ])
+        database.session.execute(database.metadata.tables['book'].insert(), [
+            {'id': i + 1, 'title': f"Title {i}", 'price': i % 50, 'client_id': i % (BOOKS // 10) + 1}
+            for i in range(BOOKS)
+        ])
+        database.session.commit()
+        database.engine.dispose()
+
+
+def paths():
+    while True:
+        yield random.choice((
+            f"/books/{random.randrange(1, BOOKS + 1)}",
+            f"/books?limit=20&after_id={random.randrange(BOOKS)}",
+            f"/clients/{random.randrange(1, BOOKS // 10 + 1)}",
+        ))
+
+
+def wait_until_up(url, timeout=20):
+    deadline = time.monotonic() + timeout
+
+    while time.monotonic() < deadline:
+        try:
+            return urlopen(url + "/books/1").read()
+        except OSError:
+            time.sleep(0.2)
+
+    raise RuntimeError(f"Server at {url} did not start")
+
+
+def load(url, clients, seconds):
+    deadline = time.monotonic() + seconds
+
+    def client(_):
+        times = list()
+
+        for path in paths():
+            if time.monotonic() > deadline:
+                return times
+
+            start = time.perf_counter()
+            urlopen(url + path).read()
+            times.append((time.perf_counter() - start) * 1000)
+
+    with ThreadPoolExecutor(clients) as executor:
+        times = [time for result in executor.map(client, range(clients)) for time in result]
+
+    return len(times) / seconds, statistics.quantiles(times, n=100)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--seconds', type=int, default=10)
+    args = parser.parse_args()
+    random.seed(0)
+    seed()
+
+    servers = {
+        'development': ([sys.executable, '-m', 'library'], "http://127.0.0.1:5000"),
+        f"gunicorn {args.workers}x{args.threads}": ([
+            sys.executable, '-m', 'library', 'serve', '--bind', '127.0.0.1:5001',
+            '--workers', str(args.workers), '--threads', str(args.threads)
+        ], "http://127.0.0.1:5001"),
+    }
+
+    print(f"{'server':<16}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+
+    for name, (command, url) in servers.items():
+        process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+        try:
+            wait_until_up(url)
+            rate, percentiles = load(url, args.clients, args.seconds)
+        finally:
+            process.terminate()
+            process.wait()
+
+        print(f"{name:<16}{rate:>9.0f}{percentiles[49]:>9.1f}{percentiles[94]:>9.1f}{percentiles[98]:>9.1f}")
+
+    directory.cleanup()
+
+
+if __name__ == '__main__':
+    main()
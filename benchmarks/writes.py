@@ -0,0 +1,72 @@
+"""Commits and latency per write request on a file backed SQLite database.
+
+    python -m benchmarks.writes --requests 200 --authors 5
+
+Every scenario creates new authors, books or clients inside the request, so
+each of them used to be committed on its own. Every commit of a file backed
+database waits for the journal to reach the disk, so the number of commits
+per request drives the latency of the write path.
+"""
+import argparse, os, statistics, tempfile, time
+
+directory = tempfile.TemporaryDirectory()
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(directory.name, 'bench.db')
+
+from sqlalchemy import event
+
+from library import app
+from library.models import database
+
+
+def scenarios(authors):
+    names = lambda i: [f"First{i}x{j} Last{i}x{j}" for j in range(authors)]
+
+    return {
+        'POST /books': lambda client, i: client.post("/books", json={
+            'title': f"Title {i}", 'authors': names(i), 'client': f"Client{i} Last{i}"
+        }),
+        'PUT /books/<id>': lambda client, i: client.put(f"/books/{i + 1}", json={
+            'authors': [name + 'put' for name in names(i)], 'client': f"Client{i} Put{i}"
+        }),
+        'POST /authors': lambda client, i: client.post("/authors", json={
+            'first_name': f"Author{i}", 'last_name': f"Last{i}", 'books': [f"Book {i} {j}" for j in range(authors)]
+        }),
+        'DELETE /books/<id>': lambda client, i: client.delete(f"/books/{i + 1}"),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--authors', type=int, default=5)
+    args = parser.parse_args()
+    commits = list()
+
+    with app.app_context():
+        database.create_all()
+        event.listen(database.session, 'after_commit', lambda session: commits.append(1))
+        client = app.test_client()
+
+        print(f"{'request':<20}{'commits':>9}{'mean ms':>10}{'p95 ms':>9}")
+
+        for name, send in scenarios(args.authors).items():
+            commits.clear()
+            times = list()
+
+            for i in range(args.requests):
+                start = time.perf_counter()
+                response = send(client, i)
+                times.append((time.perf_counter() - start) * 1000)
+                assert response.status_code < 300, response.json
+
+            p95 = statistics.quantiles(times, n=20)[-1]
+            print(f"{name:<20}{len(commits) / args.requests:>9.1f}{statistics.mean(times):>10.2f}{p95:>9.2f}")
+
+        database.session.remove()
+        database.engine.dispose()
+
+    directory.cleanup()
+
+
+if __name__ == '__main__':
+    main()
@@ -8,4 +8,68 @@ class Config:
         os.environ.get('DATABASE_URL') or 'sqlite:///' + os.path.join(BASE_DIR, 'library.db')
     )
     
-    SQLALCHEMY_TRACK_MODIFICATIONS = False
\ No newline at end of file
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # Optional read replica: GET requests read from it, the others and any
+    # request that writes use the primary database
+    REPLICA_DATABASE_URL    = os.environ.get('REPLICA_DATABASE_URL')
+    SQLALCHEMY_BINDS        = {'replica': REPLICA_DATABASE_URL} if REPLICA_DATABASE_URL else {}
+
+    # Address, processes and threads per process of "python -m library serve"
+    SERVER_BIND     = os.environ.get("SERVER_BIND") or "127.0.0.1:8000"
+    SERVER_WORKERS  = int(os.environ.get("SERVER_WORKERS") or (os.cpu_count() or 1) * 2 + 1)
+    SERVER_THREADS  = int(os.environ.get("SERVER_THREADS") or 4)
+
+    # Database connections kept open by every process and opened on top of
+    # them under load, every server thread holds one while it handles a request
+    DATABASE_POOL_SIZE      = int(os.environ.get("DATABASE_POOL_SIZE") or SERVER_THREADS)
+    DATABASE_MAX_OVERFLOW   = int(os.environ.get("DATABASE_MAX_OVERFLOW") or 10)
+
+    # Test every pooled connection before use, for servers that drop idle ones
+    DATABASE_POOL_PRE_PING  = bool(int(os.environ.get("DATABASE_POOL_PRE_PING") or 0))
+
+    # An in-memory SQLite database is a single shared connection without a pool
+    SQLALCHEMY_ENGINE_OPTIONS = {'pool_pre_ping': DATABASE_POOL_PRE_PING}
+
+    if SQLALCHEMY_DATABASE_URI not in ('sqlite://', 'sqlite:///:memory:'):
+        SQLALCHEMY_ENGINE_OPTIONS.update(pool_size=DATABASE_POOL_SIZE, max_overflow=DATABASE_MAX_OVERFLOW)
+
+    # PRAGMAs run on every new SQLite connection. WAL lets readers go on while
+    # a writer commits, NORMAL syncs the log at checkpoints only and writers
+    # wait up to busy_timeout ms for the lock instead of "database is locked".
+    # mmap_size is in bytes, a negative cache_size in KiB
+    SQLITE_PRAGMAS = {
+        'journal_mode': os.environ.get("SQLITE_JOURNAL_MODE") or 'WAL',
+        'synchronous':  os.environ.get("SQLITE_SYNCHRONOUS") or 'NORMAL',
+        'busy_timeout': int(os.environ.get("SQLITE_BUSY_TIMEOUT") or 5000),
+        'mmap_size':    int(os.environ.get("SQLITE_MMAP_SIZE") or 256 * 1024 * 1024),
+        'cache_size':   int(os.environ.get("SQLITE_CACHE_SIZE") or -64000),
+    }
+
+    # Default and maximum page size for ?limit=/&after_id= pagination
+    PAGE_LIMIT      = int(os.environ.get("PAGE_LIMIT") or 100)
+    PAGE_LIMIT_MAX  = int(os.environ.get("PAGE_LIMIT_MAX") or 1000)
+
+    # Rows read from the database per batch by whole collections and ?format=ndjson exports
+    STREAM_BATCH_SIZE = int(os.environ.get("STREAM_BATCH_SIZE") or 1000)
+
+    # Books committed per transaction by POST /books/bulk
+    BULK_BATCH_SIZE = int(os.environ.get("BULK_BATCH_SIZE") or 500)
+
+    # Rows removed per transaction by the "delete all" endpoints, 0 deletes
+    # everything in a single transaction
+    DELETE_CHUNK_SIZE = int(os.environ.get("DELETE_CHUNK_SIZE") or 0)
+
+    # Payloads of GET /books/<id>, /authors/<id> and /clients/<id> kept in
+    # the process cache and for how many seconds, 0 disables the cache
+    CACHE_SIZE  = int(os.environ.get("CACHE_SIZE") or 4096)
+    CACHE_TTL   = int(os.environ.get("CACHE_TTL") or 300)
+
+    # Author and client names and book titles resolved to ids without a query
+    # by the write endpoints, and for how many seconds, 0 disables the index.
+    # Each request reads one version row to drop names renamed by other workers
+    NAME_CACHE_SIZE = int(os.environ.get("NAME_CACHE_SIZE") or 8192)
+    NAME_CACHE_TTL  = int(os.environ.get("NAME_CACHE_TTL") or 300)
+
+    # Default number of matches per collection returned by GET /search
+    SEARCH_LIMIT = int(os.environ.get("SEARCH_LIMIT") or 20)
@@ -1,18 +1,35 @@
 from flask import Flask
 from config import Config
 from flask_migrate import Migrate
+import click
 
 from . import models
 from . import routes
+from . import search
+from . import engine
+from . import metrics
 
 from .models import database
+from .cache import cache, name_index
+from .changes import mark_changed
+from .serializers import authors_of_books
+from .dates import json_default
+from .encoders import encode_json
 
 app = Flask(__name__)
 app.config.from_object(Config)
+app.config.setdefault('RESTX_JSON', {'default': json_default})
+
+# JSON columns are written as the payloads are, compact and with sorted keys
+app.config['SQLALCHEMY_ENGINE_OPTIONS'].setdefault('json_serializer', encode_json)
 
 routes.api.init_app(app)
 models.database.init_app(app)
-migrate = Migrate(app, models.database)
+engine.init_app(app)
+metrics.init_app(app, routes.api)
+cache.init_app(app)
+name_index.init_app(app, 'NAME_CACHE')
+migrate = Migrate(app, models.database, include_object=search.include_object)
 migrate.init_app(app, models.database)
 
 
@@ -23,4 +40,35 @@ def make_shell_context():
         "Book": models.Book,
         "Author": models.Author,
         "Client": models.Client
-    }
\ No newline at end of file
+    }
+
+
+@app.cli.command('check-authors-summary')
+@click.option('--fix', is_flag=True, help="Rebuild the summaries that differ.")
+def check_authors_summary(fix):
+    """Compare Book.authors_summary with the books_authors links."""
+    stale = list()
+    last_id = 0
+    by_id = lambda authors: sorted(authors or [], key=lambda author: author['id'])
+
+    while True:
+        books = models.Book.query.filter(models.Book.id > last_id).order_by(models.Book.id).limit(1000).all()
+
+        if not books:
+            break
+
+        authors = authors_of_books(models.Book.query.filter(models.Book.id.in_([book.id for book in books])))
+        stale.extend(
+            book.id for book in books
+            if book.authors_summary is None or by_id(book.authors_summary) != by_id(authors.get(book.id))
+        )
+        last_id = books[-1].id
+
+    click.echo(f"{len(stale)} book(s) with a stale authors summary")
+
+    if stale and fix:
+        mark_changed(books=stale)
+        database.session.commit()
+        click.echo("Fixed")
+    elif stale:
+        raise SystemExit(1)
@@ -1,3 +1,44 @@
+import click
+
 from . import app
+from .server import serve as run_server, serve_async as run_async_server
+
+
+@click.group(invoke_without_command=True)
+@click.pass_context
+def main(context):
+    """Run the library API, with the development server without a command."""
+    if context.invoked_subcommand is None:
+        app.run(debug=False)
+
+
+@main.command()
+@click.option('--bind', help="Address to listen on, SERVER_BIND by default.")
+@click.option('--workers', type=click.IntRange(1), help="Processes, SERVER_WORKERS by default.")
+@click.option('--threads', type=click.IntRange(1), help="Threads per process, SERVER_THREADS by default.")
+def serve(bind, workers, threads):
+    """Serve the API with gunicorn processes and threads."""
+    try:
+        run_server(
+            app,
+            bind or app.config['SERVER_BIND'],
+            workers or app.config['SERVER_WORKERS'],
+            threads or app.config['SERVER_THREADS']
+        )
+    except RuntimeError as error:
+        raise click.ClickException(str(error))
+
+
+@main.command('serve-async')
+@click.option('--bind', help="Address to listen on, SERVER_BIND by default.")
+@click.option('--workers', type=click.IntRange(1), help="Processes, SERVER_WORKERS by default.")
+def serve_async(bind, workers):
+    """Serve the API with uvicorn, reading collections and records on an async engine."""
+    try:
+        run_async_server(bind or app.config['SERVER_BIND'], workers or app.config['SERVER_WORKERS'])
+    except RuntimeError as error:
+        raise click.ClickException(str(error))
+
 
-app.run(debug=False)
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,231 @@
+from contextlib import asynccontextmanager
+from functools import partial
+
+from a2wsgi import WSGIMiddleware
+from flask import current_app, Response as FlaskResponse
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import create_async_engine
+from starlette.applications import Starlette
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Route, Mount
+from werkzeug.exceptions import HTTPException
+from werkzeug.test import EnvironBuilder
+
+from .models import database, TableVersion
+from .cache import cache
+from .changes import MODELS
+from .engine import pragma_setter
+from .replica import REPLICA
+from .routes import api, collection_args, book_args, fields_args, filter_books, NDJSON
+from .routes import collection_request, collection_etag, item_etag, cached_row, requested_fields, unknown_fields
+from .routes import not_modified, validated, negotiated, json_response, json_array
+from .routes import page_query, page_response, ids_response
+from .serializers import FIELDS, RELATED, row_statement, with_books, group_books, encode_rows
+
+# Async drivers by the backend of the configured database
+DRIVERS = {'sqlite': 'sqlite+aiosqlite', 'postgresql': 'postgresql+asyncpg'}
+
+# Parser and filters of each collection
+COLLECTIONS = {
+    'books': (book_args, filter_books),
+    'authors': (collection_args, None),
+    'clients': (collection_args, None),
+}
+
+MISSING = {'books': "Book is not find", 'authors': "Author is not find", 'clients': "Client is not find"}
+
+
+def async_engine(app):
+    # Reads go to the replica when there is one, as GET requests of the Flask app do
+    with app.app_context():
+        url = database.engines.get(REPLICA, database.engine).url
+
+    backend = url.get_backend_name()
+    engine = create_async_engine(
+        url.set(drivername=DRIVERS.get(backend, url.drivername)), **app.config['SQLALCHEMY_ENGINE_OPTIONS']
+    )
+
+    # Nothing is ever written through these connections
+    if backend == 'sqlite':
+        pragmas = {**app.config['SQLITE_PRAGMAS'], 'query_only': 'ON'}
+        event.listen(engine.sync_engine, 'connect', pragma_setter(pragmas))
+
+    return engine
+
+
+async def fetch_rows(connection, kind, query, fields):
+    rows = (await connection.execute(row_statement(kind, query, fields))).all()
+
+    if 'books' in fields:
+        rows = with_books(rows, group_books(await connection.execute(RELATED[kind](query))))
+
+    return rows
+
+
+async def encoded_batches(connection, kind, query, fields, size):
+    # Rows come from a cursor left open on the connection, size at a time
+    books = group_books(await connection.execute(RELATED[kind](query))) if 'books' in fields else None
+    result = await connection.stream(row_statement(kind, query, fields))
+
+    async for rows in result.partitions(size):
+        yield encode_rows(kind, rows if books is None else with_books(rows, books), fields)
+
+
+async def ndjson_lines(engine, kind, query, fields, size):
+    # The stream outlives the request handler, so it reads on a connection of its own
+    async with engine.connect() as connection:
+        async for items in encoded_batches(connection, kind, query, fields, size):
+            if items:
+                yield '\n'.join(text for _, text in items) + '\n'
+
+
+async def read_collection(engine, kind):
+    parser, refine = COLLECTIONS[kind]
+    args, fields, ndjson, error = collection_request(kind, parser)
+
+    if error:
+        return error
+
+    model = MODELS[kind]
+    query = refine(model.query, args) if refine else model.query
+    size = current_app.config['STREAM_BATCH_SIZE']
+
+    async with engine.connect() as connection:
+        version = (await connection.execute(
+            select(TableVersion.version, TableVersion.updated_at).where(TableVersion.name == kind)
+        )).first()
+        updated_at = version.updated_at if version else None
+        etag = collection_etag(kind, version, fields, ndjson, args['ids'])
+        response = not_modified(etag, updated_at)
+
+        if response:
+            return negotiated(response)
+
+        if ndjson:
+            query = query.filter(model.id > (args['after_id'] or 0)).order_by(None).order_by(model.id)
+            lines = ndjson_lines(engine, kind, query.limit(args['limit']) if args['limit'] else query, fields, size)
+
+            return streamed(negotiated(validated(FlaskResponse(mimetype=NDJSON), etag, updated_at)), lines)
+
+        if args['ids'] is not None:
+            rows = await fetch_rows(connection, kind, query.filter(model.id.in_(args['ids'])), fields)
+
+            return negotiated(validated(ids_response(args['ids'], encode_rows(kind, rows, fields)), etag, updated_at))
+
+        if args['limit'] is None and args['after_id'] is None:
+            chunks = [
+                ','.join(text for _, text in items)
+                async for items in encoded_batches(connection, kind, query, fields, size) if items
+            ]
+
+            return negotiated(validated(json_array(chunks), etag, updated_at))
+
+        query, limit = page_query(model, query, args)
+        items = encode_rows(kind, await fetch_rows(connection, kind, query, fields), fields)
+
+    return negotiated(validated(page_response(items, limit), etag, updated_at))
+
+
+async def read_item(engine, kind, id):
+    fields = requested_fields(kind, fields_args.parse_args()['fields'])
+
+    if fields is None:
+        return unknown_fields(kind)
+
+    model = MODELS[kind]
+    token = cache.token()
+
+    async with engine.connect() as connection:
+        found = (await connection.execute(select(model.updated_at).where(model.id == id))).first()
+
+        if found is None:
+            return {'Error': MISSING[kind]}, 404
+
+        updated_at = found.updated_at
+        etag = item_etag(kind, id, updated_at, fields)
+        response = not_modified(etag, updated_at)
+
+        if response:
+            return response
+
+        # The item cache is shared with the Flask application, as item_response uses it
+        row = cached_row(kind, id, updated_at)
+
+        if row is None:
+            rows = await fetch_rows(connection, kind, model.query.filter_by(id=id), fields)
+
+            if not rows:
+                return {'Error': MISSING[kind]}, 404
+
+            row, selected = rows[0], fields
+
+            if fields == FIELDS[kind]:
+                cache.set((kind, id), (row, updated_at), token)
+        else:
+            selected = FIELDS[kind]
+
+    [(_, payload)] = encode_rows(kind, [row], fields, selected)
+
+    return validated(json_response(payload), etag, updated_at)
+
+
+def streamed(response, body):
+    # Status and headers of a Flask response, the body of an async generator
+    headers = {name: value for name, value in response.headers.items() if name.lower() != 'content-length'}
+
+    return StreamingResponse(body, response.status_code, headers)
+
+
+def asgi_response(result):
+    if isinstance(result, Response):
+        return result
+
+    # Error payloads are written by the representation of the Flask-RESTX api
+    if isinstance(result, tuple):
+        result = api.make_response(*result)
+
+    return Response(result.get_data(), result.status_code, dict(result.headers))
+
+
+def endpoint(app, read):
+    # The handler runs in a Flask request context built from the ASGI request,
+    # so the parsers, ETags and encoders of the Flask routes work unchanged
+    async def handle(incoming):
+        environ = EnvironBuilder(
+            path=incoming.url.path, query_string=incoming.url.query, method=incoming.method,
+            headers=list(incoming.headers.items())
+        ).get_environ()
+
+        with app.request_context(environ):
+            try:
+                result = await read(**incoming.path_params)
+            except HTTPException as error:
+                result = (getattr(error, 'data', None) or {'message': error.description}), error.code
+
+            return asgi_response(result)
+
+    return handle
+
+
+def create_application(app=None):
+    # GET of the collections and records runs on an async engine, every
+    # other request is handed to the Flask application on a thread
+    if app is None:
+        from . import app
+
+    engine = async_engine(app)
+
+    @asynccontextmanager
+    async def lifespan(application):
+        yield
+        await engine.dispose()
+
+    routes = list()
+
+    for kind in MODELS:
+        routes.append(Route(f'/{kind}', endpoint(app, partial(read_collection, engine, kind)), methods=['GET']))
+        routes.append(Route(f'/{kind}/{{id:int}}', endpoint(app, partial(read_item, engine, kind)), methods=['GET']))
+
+    routes.append(Mount('/', WSGIMiddleware(app, workers=app.config['SERVER_THREADS'])))
+
+    return Starlette(routes=routes, lifespan=lifespan)
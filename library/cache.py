@@ -0,0 +1,79 @@
+from collections import OrderedDict
+from threading import Lock
+import time
+
+
+class ResponseCache:
+
+    def __init__(self, size=1024, ttl=60):
+        self.size = size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = Lock()
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def init_app(self, app, prefix='CACHE'):
+        self.size = app.config[f'{prefix}_SIZE']
+        self.ttl = app.config[f'{prefix}_TTL']
+
+    def token(self):
+        # Taken before reading the database, set() refuses the value when an
+        # invalidation happened in the meantime, so stale rows are not cached
+        return self.generation
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+
+            if entry is None or entry[1] < time.monotonic():
+                if entry is not None:
+                    del self.entries[key]
+                    self.evictions += 1
+
+                self.misses += 1
+                return None
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+
+            return entry[0]
+
+    def set(self, key, value, token):
+        with self.lock:
+            if not self.size or token != self.generation:
+                return
+
+            self.entries[key] = (value, time.monotonic() + self.ttl)
+            self.entries.move_to_end(key)
+
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, *keys):
+        with self.lock:
+            self.generation += 1
+
+            for key in keys:
+                self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.generation += 1
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            return {
+                'size': len(self.entries), 'max_size': self.size, 'ttl': self.ttl,
+                'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions
+            }
+
+
+cache = ResponseCache()
+
+# (kind, *name) -> (id, names version) of authors, clients and books
+name_index = ResponseCache()
@@ -0,0 +1,154 @@
+from sqlalchemy import event, bindparam, select
+
+from .models import Book, Author, Client, TableVersion
+from .models import database, utcnow
+from .serializers import authors_of_books
+from .cache import cache, name_index
+
+# Stands for every row of a collection
+ALL = 'all'
+
+MODELS = {'books': Book, 'authors': Author, 'clients': Client}
+
+# Largest number of ids stamped by a single UPDATE
+STAMP_CHUNK = 400
+
+# Version row bumped by every commit that renames or deletes a name
+NAMES = 'names'
+
+
+def mark_changed(books=(), authors=(), clients=()):
+    # Record the rows whose JSON payload changes with the pending transaction.
+    # They get a new updated_at and collection version right before the commit
+    # and their cached payloads are dropped once the commit went through
+    changed = database.session.info.setdefault('changed', dict())
+
+    for kind, ids in (('books', books), ('authors', authors), ('clients', clients)):
+        if ids == ALL or changed.get(kind) == ALL:
+            changed[kind] = ALL
+        elif ids:
+            changed.setdefault(kind, set()).update(id for id in ids if id is not None)
+
+
+def remember_name(key, id, version, token):
+    # Names enter the index once the row they point to is committed
+    database.session.info.setdefault('names', list()).append((key, (id, version), token))
+
+
+def forget_names(*keys):
+    # Renamed and deleted names leave the index once the change is committed,
+    # ALL empties it
+    database.session.info.setdefault('forgotten', set()).update(keys)
+
+
+def collection_version(kind):
+    return database.session.get(TableVersion, kind)
+
+
+def names_version():
+    # Read once per transaction and before any name is looked up, so an index
+    # entry never carries a version newer than the rows it was read from
+    info = database.session.info
+
+    if 'names_version' not in info:
+        info['names_version'] = database.session.query(TableVersion.version).filter_by(name=NAMES).scalar() or 0
+
+    return info['names_version']
+
+
+def bump_version(session, name, now):
+    # Incremented by the database, concurrent commits never share a version
+    versions = TableVersion.__table__
+    bumped = session.execute(
+        versions.update().where(versions.c.name == name).values(version=versions.c.version + 1, updated_at=now)
+    )
+
+    if not bumped.rowcount:
+        session.add(TableVersion(name=name, version=1, updated_at=now))
+
+
+def refresh_authors_summary(session, ids):
+    # Rebuild Book.authors_summary of the given books with one join per chunk.
+    # The books are locked first, in id order, so a concurrent commit that
+    # links the same books waits and then reads the links of this one
+    ids = sorted(ids)
+    table = Book.__table__
+    statement = table.update().where(table.c.id == bindparam('book_id')).values(
+        authors_summary=bindparam('summary')
+    )
+
+    for start in range(0, len(ids), STAMP_CHUNK):
+        chunk = ids[start:start + STAMP_CHUNK]
+        session.execute(select(table.c.id).where(table.c.id.in_(chunk)).order_by(table.c.id).with_for_update())
+        authors = authors_of_books(Book.query.filter(Book.id.in_(chunk)))
+
+        session.execute(statement, [{'book_id': id, 'summary': authors.get(id, [])} for id in chunk])
+
+
+@event.listens_for(database.session, 'before_commit')
+def stamp_changes(session):
+    changed = session.info.get('changed') or dict()
+    forgotten = session.info.get('forgotten')
+
+    if not changed and not forgotten:
+        return
+
+    now = utcnow()
+
+    # Every change of a book payload may come from its authors. Collections
+    # are changed as a whole by deleting them only: without any author or book
+    # no link is left, deleted clients leave the summaries as they are
+    if changed.get('authors') == ALL:
+        session.execute(Book.__table__.update().values(authors_summary=None))
+    elif changed.get('books') and changed['books'] != ALL:
+        refresh_authors_summary(session, changed['books'])
+
+    for kind, ids in changed.items():
+        table = MODELS[kind].__table__
+
+        if ids == ALL:
+            session.execute(table.update().values(updated_at=now))
+        else:
+            ids = list(ids)
+
+            for start in range(0, len(ids), STAMP_CHUNK):
+                session.execute(
+                    table.update().where(table.c.id.in_(ids[start:start + STAMP_CHUNK])).values(updated_at=now)
+                )
+
+        bump_version(session, kind, now)
+
+    # Index entries of other processes are dropped as this one forgets names
+    if forgotten or ALL in changed.values():
+        bump_version(session, NAMES, now)
+
+
+@event.listens_for(database.session, 'after_commit')
+def forget_changes(session):
+    session.info.pop('names_version', None)
+    changed = session.info.pop('changed', None)
+    forgotten = session.info.pop('forgotten', None)
+
+    if forgotten and ALL in forgotten:
+        name_index.clear()
+    elif forgotten:
+        name_index.invalidate(*forgotten)
+
+    for key, entry, token in session.info.pop('names', ()):
+        name_index.set(key, entry, token)
+
+    if not changed:
+        return
+
+    if ALL in changed.values():
+        cache.clear()
+        name_index.clear()
+        return
+
+    cache.invalidate(*[(kind, id) for kind, ids in changed.items() for id in ids])
+
+
+@event.listens_for(database.session, 'after_rollback')
+def drop_changes(session):
+    for name in ('changed', 'names', 'forgotten', 'names_version'):
+        session.info.pop(name, None)
@@ -0,0 +1,33 @@
+from datetime import date, datetime
+from flask.json.provider import DefaultJSONProvider
+
+# Form fields holding a calendar date
+DATE_FIELDS = ('birth', 'death', 'premiere')
+
+
+def parse_date(value):
+    # ISO 8601 dates, YYYY-MM-DD, without strptime's locale lock and regex
+    if isinstance(value, datetime):
+        return value.date()
+
+    if isinstance(value, date):
+        return value
+
+    return date.fromisoformat(value)
+
+
+def format_date(value):
+    return value.isoformat()
+
+
+def json_default(value):
+    # Dates and datetimes are written as ISO 8601 instead of HTTP dates
+    if isinstance(value, date):
+        return format_date(value)
+
+    return DefaultJSONProvider.default(value)
+
+
+class JSONProvider(DefaultJSONProvider):
+
+    default = staticmethod(json_default)
@@ -0,0 +1,53 @@
+from json import dumps
+from json.encoder import encode_basestring_ascii
+from sqlalchemy import Integer, Float, String, Date, DateTime
+
+from .dates import format_date
+
+
+def encode_date(value):
+    return f'"{format_date(value)}"'
+
+
+def encode_json(value):
+    return dumps(value, separators=(',', ':'), sort_keys=True)
+
+
+def encode_raw(value):
+    # The value is JSON text already, as read from a JSON column
+    return value
+
+
+# Encoder of a value by the type of its column, JSON for anything else
+TYPES = (
+    (Integer, repr),
+    (Float, repr),
+    (DateTime, encode_date),
+    (Date, encode_date),
+    (String, encode_basestring_ascii),
+)
+
+
+def value_encoder(column_type):
+    for kind, encoder in TYPES:
+        if isinstance(column_type, kind):
+            return encoder
+
+    return encode_json
+
+
+def compile_encoder(keys):
+    # keys holds (name, index, encoder) in the output order. The generated
+    # function writes a row tuple as one JSON object: the keys are encoded
+    # once here and each value goes through the encoder of its column
+    namespace, parts = dict(), list()
+
+    for position, (name, index, encoder) in enumerate(keys):
+        prefix = ('{' if position == 0 else ',') + encode_basestring_ascii(name) + ':'
+        namespace[f'encode{position}'] = encoder
+        parts.append(f"{prefix!r} + ('null' if row[{index}] is None else encode{position}(row[{index}]))")
+
+    source = f"def encode(row):\n    return {' + '.join(parts) or repr('{')} + '}}'\n"
+    exec(source, namespace)
+
+    return namespace['encode']
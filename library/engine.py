@@ -0,0 +1,31 @@
+from sqlalchemy import event
+
+from .models import database
+from .replica import REPLICA
+
+
+def init_app(app):
+    with app.app_context():
+        for key, engine in database.engines.items():
+            if engine.dialect.name != 'sqlite':
+                continue
+
+            pragmas = dict(app.config['SQLITE_PRAGMAS'])
+
+            # Nothing is ever written through the replica connections
+            if key == REPLICA:
+                pragmas['query_only'] = 'ON'
+
+            event.listen(engine, 'connect', pragma_setter(pragmas))
+
+
+def pragma_setter(pragmas):
+    def set_pragmas(connection, record):
+        cursor = connection.cursor()
+
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+
+        cursor.close()
+
+    return set_pragmas
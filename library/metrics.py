@@ -0,0 +1,137 @@
+from collections import defaultdict
+from contextlib import contextmanager
+from flask import g, request, has_app_context
+from flask_restx.representations import output_json
+from sqlalchemy import event
+from threading import Lock
+import time
+
+from .models import database
+from .dates import JSONProvider
+
+# Totals kept per method and endpoint, exported as Prometheus counters
+COUNTERS = {
+    'requests_total': "Requests handled",
+    'request_seconds_total': "Time spent handling requests",
+    'sql_statements_total': "SQL statements executed",
+    'sql_seconds_total': "Time spent executing SQL statements",
+    'serialize_seconds_total': "Time spent encoding JSON",
+    'response_bytes_total': "Bytes of response bodies, streamed ones are not counted",
+}
+
+
+class RequestMetrics:
+
+    def __init__(self):
+        self.lock = Lock()
+        self.totals = defaultdict(lambda: dict.fromkeys(COUNTERS, 0))
+
+    def record(self, method, endpoint, **values):
+        with self.lock:
+            totals = self.totals[(method, endpoint)]
+
+            for name, value in values.items():
+                totals[name] += value
+
+    def clear(self):
+        with self.lock:
+            self.totals.clear()
+
+    def render(self):
+        lines = list()
+
+        with self.lock:
+            for name, description in COUNTERS.items():
+                lines.append(f"# HELP library_{name} {description}.")
+                lines.append(f"# TYPE library_{name} counter")
+
+                for (method, endpoint), totals in sorted(self.totals.items()):
+                    lines.append(f'library_{name}{{method="{method}",endpoint="{endpoint}"}} {totals[name]:g}')
+
+        return '\n'.join(lines) + '\n'
+
+
+metrics = RequestMetrics()
+
+
+@contextmanager
+def timer(name):
+    # Adds the time spent in the block to the measures of the current request
+    start = time.perf_counter()
+
+    try:
+        yield
+    finally:
+        if has_app_context() and 'measures' in g:
+            g.measures[name] += time.perf_counter() - start
+
+
+class TimedJSONProvider(JSONProvider):
+
+    def dumps(self, obj, **kwargs):
+        with timer('serialize'):
+            return super().dumps(obj, **kwargs)
+
+
+def timed_output_json(data, code, headers=None):
+    with timer('serialize'):
+        return output_json(data, code, headers)
+
+
+def before_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+    connection.info.setdefault('started', list()).append(time.perf_counter())
+
+
+def after_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - connection.info['started'].pop()
+
+    if has_app_context() and 'measures' in g:
+        g.measures['sql'] += elapsed
+        g.measures['statements'] += 1
+
+
+def forget_statement(context):
+    # A failed statement never reaches after_cursor_execute
+    if context.connection is not None and context.connection.info.get('started'):
+        context.connection.info['started'].pop()
+
+
+def start_request():
+    g.measures = {'start': time.perf_counter(), 'sql': 0.0, 'serialize': 0.0, 'statements': 0}
+
+
+def finish_request(response):
+    measures = g.pop('measures', None)
+
+    if measures is None:
+        return response
+
+    elapsed = time.perf_counter() - measures['start']
+    size = 0 if response.is_streamed else response.calculate_content_length() or 0
+
+    response.headers['Server-Timing'] = ', '.join((
+        f'db;dur={measures["sql"] * 1000:.2f};desc="{measures["statements"]} queries"',
+        f'serialize;dur={measures["serialize"] * 1000:.2f}',
+        f'total;dur={elapsed * 1000:.2f}',
+    ))
+    metrics.record(
+        request.method, request.url_rule.rule if request.url_rule else 'unmatched',
+        requests_total=1, request_seconds_total=elapsed, sql_statements_total=measures['statements'],
+        sql_seconds_total=measures['sql'], serialize_seconds_total=measures['serialize'],
+        response_bytes_total=size
+    )
+
+    return response
+
+
+def init_app(app, api):
+    app.json = TimedJSONProvider(app)
+    api.representation('application/json')(timed_output_json)
+    app.before_request(start_request)
+    app.after_request(finish_request)
+
+    with app.app_context():
+        for engine in database.engines.values():
+            event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+            event.listen(engine, 'after_cursor_execute', after_cursor_execute)
+            event.listen(engine, 'handle_error', forget_statement)
@@ -1,12 +1,19 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_restx import fields
+from datetime import datetime, timezone
 
-database = SQLAlchemy()
+from .replica import RoutingSession
+
+database = SQLAlchemy(session_options={'class_': RoutingSession})
+
+
+def utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
 
 books_authors = database.Table(
     'books_authors',
-    database.Column('book_id', database.Integer, database.ForeignKey('book.id')),
-    database.Column('author_id', database.Integer, database.ForeignKey('author.id'))
+    database.Column('book_id', database.Integer, database.ForeignKey('book.id'), primary_key=True),
+    database.Column('author_id', database.Integer, database.ForeignKey('author.id'), primary_key=True, index=True)
 )
 
 
@@ -21,10 +28,15 @@ class Book(database.Model):
     }
 
     id = database.Column(database.Integer, primary_key=True)
-    title = database.Column(database.String(256), nullable=False)
-    premiere = database.Column(database.Date())
-    price = database.Column(database.Float)
-    client_id = database.Column(database.Integer, database.ForeignKey('client.id'))
+    title = database.Column(database.String(256), nullable=False, index=True, unique=True)
+    premiere = database.Column(database.Date(), index=True)
+    price = database.Column(database.Float, index=True)
+    client_id = database.Column(database.Integer, database.ForeignKey('client.id'), index=True)
+    updated_at = database.Column(database.DateTime, default=utcnow, onupdate=utcnow)
+
+    # Denormalized [{'name', 'id'}] list of the authors, kept current on commit.
+    # Stored as compact JSON with sorted keys, payloads embed it unchanged
+    authors_summary = database.Column(database.JSON(none_as_null=True))
 
     authors = database.relationship(
         "Author",
@@ -47,11 +59,14 @@ class Author(database.Model):
         'books': fields.List(fields.String())
     }
 
+    __table_args__ = (database.Index('ix_author_name', 'first_name', 'last_name', unique=True),)
+
     id = database.Column(database.Integer, primary_key=True)
     first_name = database.Column(database.String(256), nullable=False)
     last_name = database.Column(database.String(256), nullable=False)
     birth = database.Column(database.Date())
     death = database.Column(database.Date())
+    updated_at = database.Column(database.DateTime, default=utcnow, onupdate=utcnow)
 
     books = database.relationship(
         "Book",
@@ -72,10 +87,24 @@ class Client(database.Model):
         'books': fields.List(fields.String())
     }
 
+    __table_args__ = (database.Index('ix_client_name', 'first_name', 'last_name', unique=True),)
+
     id = database.Column(database.Integer, primary_key=True)
     first_name = database.Column(database.String(256), nullable=False)
     last_name = database.Column(database.String(256), nullable=False)
+    updated_at = database.Column(database.DateTime, default=utcnow, onupdate=utcnow)
     books = database.relationship("Book", backref='book')
 
     def __str__(self):
         return f"Client: {self.first_name} {self.last_name}"
+
+
+class TableVersion(database.Model):
+
+    # One row per collection, bumped on every commit that changes a payload of it
+    name = database.Column(database.String(64), primary_key=True)
+    version = database.Column(database.Integer, nullable=False, default=0)
+    updated_at = database.Column(database.DateTime, nullable=False, default=utcnow)
+
+    def __str__(self):
+        return f"Version: {self.name} {self.version} ({self.updated_at})"
@@ -0,0 +1,101 @@
+from sqlalchemy.dialects import sqlite, postgresql
+from sqlalchemy.orm import make_transient_to_detached
+
+from .models import Book, Author, Client
+from .models import database
+from .cache import name_index
+from .changes import remember_name, forget_names, names_version, ALL
+
+KINDS = {Book: 'books', Author: 'authors', Client: 'clients'}
+
+# Dialects that can skip a row violating a unique constraint
+INSERTS = {'sqlite': sqlite.insert, 'postgresql': postgresql.insert}
+
+
+def name_key(model, values):
+    return (KINDS[model], *values.values())
+
+
+def attach(model, id, values):
+    # A row known by its id joins the session without being read, the
+    # columns not given here load on first access
+    session = database.session
+    instance = session.identity_map.get(session.identity_key(model, id))
+
+    if instance is None:
+        instance = model(id=id, **values)
+        make_transient_to_detached(instance)
+        session.add(instance)
+
+    return instance
+
+
+def find(model, **values):
+    # Entries of the index are used only while no name was renamed or deleted
+    # since they were stored, by this process or any other
+    key = name_key(model, values)
+    version = names_version()
+    entry = name_index.get(key)
+
+    if entry is not None and entry[1] == version:
+        return attach(model, entry[0], values)
+
+    token = name_index.token()
+    instance = model.query.filter_by(**values).first()
+
+    if instance:
+        remember_name(key, instance.id, version, token)
+
+    return instance
+
+
+def create(model, **values):
+    # The unique name index decides between concurrent requests: the row
+    # inserted first wins and the others read it instead of failing
+    insert = INSERTS.get(database.session.get_bind().dialect.name)
+    version = names_version()
+    token = name_index.token()
+
+    if insert is None:
+        instance = model(**values)
+        database.session.add(instance)
+        database.session.flush()
+    else:
+        id = database.session.execute(
+            insert(model).values(**values).on_conflict_do_nothing().returning(model.id)
+        ).scalar()
+
+        if id is None:
+            return find(model, **values)
+
+        instance = attach(model, id, values)
+
+    remember_name(name_key(model, values), instance.id, version, token)
+
+    return instance
+
+
+def create_all(model, rows, *columns):
+    # create for many rows at once, the rows another request inserted first
+    # are skipped. Returns the given columns of the rows inserted
+    insert = INSERTS.get(database.session.get_bind().dialect.name)
+
+    if not rows:
+        return []
+
+    statement = model.__table__.insert() if insert is None else insert(model).on_conflict_do_nothing()
+
+    if columns:
+        return database.session.execute(statement.returning(*columns), rows).all()
+
+    database.session.execute(statement, rows)
+
+    return []
+
+
+def forget(model, **values):
+    forget_names(name_key(model, values))
+
+
+def forget_all():
+    forget_names(ALL)
@@ -0,0 +1,32 @@
+from flask import request, has_request_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+
+# Bind key of the optional read replica in SQLALCHEMY_BINDS
+REPLICA = 'replica'
+
+# Set in the WSGI environ of a request once its session flushed a change
+WROTE = 'library.wrote'
+
+
+class RoutingSession(Session):
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self.reads_replica():
+            return self._db.engines[REPLICA]
+
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def reads_replica(self):
+        # GET and HEAD read from the replica until they write something, any
+        # other request uses the primary, so a request always reads its writes
+        return (
+            REPLICA in self._db.engines and has_request_context()
+            and request.method in ('GET', 'HEAD') and WROTE not in request.environ
+        )
+
+
+@event.listens_for(RoutingSession, 'before_flush')
+def use_primary(session, context, instances):
+    if has_request_context():
+        request.environ[WROTE] = True
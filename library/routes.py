@@ -1,43 +1,450 @@
-from flask_restx import Api, Resource
-from flask import jsonify, request
-from datetime import datetime
+from flask_restx import Api, Resource, reqparse, inputs, fields as model_fields
+from flask import jsonify, request, current_app, Response, stream_with_context
+from jsonschema import Draft4Validator
+from sqlalchemy import select, tuple_
+from itertools import islice
+from datetime import timezone
+import hashlib
+import json
 
 from .models import Book, Author, Client
-from .models import database
+from .models import database, books_authors
+from .cache import cache
+from .metrics import metrics
+from .changes import mark_changed, collection_version, MODELS, ALL
+from .search import search, INDEXES
+from .dates import parse_date, DATE_FIELDS
+from . import names
+from .serializers import serialize_books, serialize_authors, serialize_clients, FIELDS
+from .serializers import select_rows, encode_rows, encode_batches, encode_page, encode_ids
 
 api = Api()
 
+def id_list(value):
+    # Comma separated ids, duplicates dropped, at most PAGE_LIMIT_MAX of them
+    try:
+        ids = list(dict.fromkeys(int(id) for id in value.split(',') if id.strip()))
+    except ValueError:
+        ids = None
+
+    if not ids or min(ids) < 1:
+        raise ValueError("ids must be a comma separated list of positive integers")
+
+    if len(ids) > current_app.config['PAGE_LIMIT_MAX']:
+        raise ValueError(f"At most {current_app.config['PAGE_LIMIT_MAX']} ids can be requested at once")
+
+    return ids
+
+
+collection_args = reqparse.RequestParser()
+collection_args.add_argument('limit', type=inputs.positive, location='args')
+collection_args.add_argument('after_id', type=inputs.natural, location='args')
+collection_args.add_argument('format', choices=('json', 'ndjson'), location='args')
+collection_args.add_argument('fields', location='args')
+collection_args.add_argument('ids', type=id_list, location='args')
+
+fields_args = reqparse.RequestParser()
+fields_args.add_argument('fields', location='args')
+
+
+BOOK_SORTS = {
+    'id': (Book.id,), '-id': (Book.id.desc(),),
+    'title': (Book.title, Book.id), '-title': (Book.title.desc(), Book.id.desc()),
+    'price': (Book.price, Book.id), '-price': (Book.price.desc(), Book.id.desc()),
+    'premiere': (Book.premiere, Book.id), '-premiere': (Book.premiere.desc(), Book.id.desc()),
+}
+
+book_args = collection_args.copy()
+book_args.add_argument('price_min', type=float, location='args')
+book_args.add_argument('price_max', type=float, location='args')
+book_args.add_argument('premiere_from', type=parse_date, location='args')
+book_args.add_argument('premiere_to', type=parse_date, location='args')
+book_args.add_argument('author_id', type=inputs.natural, location='args')
+book_args.add_argument('client_id', type=inputs.natural, location='args')
+book_args.add_argument('available', type=inputs.boolean, location='args')
+book_args.add_argument('sort', choices=tuple(BOOK_SORTS), location='args')
+
+delete_args = reqparse.RequestParser()
+delete_args.add_argument('chunk_size', type=inputs.positive, location='args')
+
+search_args = reqparse.RequestParser()
+search_args.add_argument('q', required=True, location='args')
+search_args.add_argument('type', choices=tuple(INDEXES), action='append', location='args')
+search_args.add_argument('limit', type=inputs.positive, location='args')
+
+# PATCH forms: every field is optional and an association is changed with
+# lists of names or titles to add and to remove
+link_lists = api.model('LinkChanges', {
+    'add': model_fields.List(model_fields.String()),
+    'remove': model_fields.List(model_fields.String()),
+})
+book_changes = api.model('BookChanges', {
+    'title': model_fields.String(),
+    'premiere': model_fields.String(),
+    'price': model_fields.Float(),
+    'client': model_fields.String(),
+    'authors': model_fields.Nested(link_lists),
+})
+author_changes = api.model('AuthorChanges', {
+    'first_name': model_fields.String(),
+    'last_name': model_fields.String(),
+    'birth': model_fields.String(),
+    'death': model_fields.String(),
+    'books': model_fields.Nested(link_lists),
+})
+client_changes = api.model('ClientChanges', {
+    'first_name': model_fields.String(),
+    'last_name': model_fields.String(),
+    'books': model_fields.Nested(link_lists),
+})
+
+NDJSON = 'application/x-ndjson'
+
+# Largest number of values bound to a single IN clause
+IN_CHUNK = 400
+
+# Stands for an NDJSON line of a bulk import that is not JSON
+INVALID_LINE = object()
 
-def add_value_from_form(form, name, last_value=None):
-    if type(last_value) == datetime:
-        last_value = last_value.strftime('%Y-%m-%d')
 
+def add_value_from_form(form, name, last_value=None):
     try:
         value = last_value
         value = form[name]
 
-        if name in ['birth', 'death', 'premiere']:
-            value = datetime.strptime(value, '%Y-%m-%d')
+        if name in DATE_FIELDS:
+            value = parse_date(value)
             
     except KeyError:
         pass
-    except ValueError:
+    except (TypeError, ValueError):
         return None
 
     return value
 
 
+def wants_ndjson(args):
+    if args['format']:
+        return args['format'] == 'ndjson'
+
+    return request.accept_mimetypes.best_match(['application/json', NDJSON]) == NDJSON
+
+
+def stream(model, serialize, query, after_id, limit, fields):
+    batch_size = current_app.config['STREAM_BATCH_SIZE']
+
+    # Rows are read in keyset batches and written out one line per record,
+    # so only a single batch is held in memory at a time
+    def generate():
+        last_id, remaining = after_id, limit
+
+        while remaining is None or remaining > 0:
+            size = batch_size if remaining is None else min(batch_size, remaining)
+            rows = serialize(query.filter(model.id > last_id).order_by(None).order_by(model.id).limit(size), fields)
+
+            if rows:
+                yield '\n'.join(text for _, text in rows) + '\n'
+
+            if len(rows) < size:
+                break
+
+            last_id = rows[-1][0]
+            remaining = None if remaining is None else remaining - len(rows)
+
+    return Response(stream_with_context(generate()), mimetype=NDJSON)
+
+
+def json_response(body):
+    return Response(body + '\n', mimetype='application/json')
+
+
+def json_array(chunks):
+    # The body of a whole collection is kept as its encoded batches,
+    # they are never joined into one string
+    body = ['[']
+
+    for chunk in chunks:
+        body.extend((',', chunk) if len(body) > 1 else (chunk,))
+
+    body.append(']\n')
+
+    return Response(body, mimetype='application/json')
+
+
+def not_modified(etag, last_modified):
+    # The client already holds this version, nothing has to be serialized
+    if request.if_none_match:
+        fresh = request.if_none_match.contains(etag)
+    else:
+        fresh = bool(last_modified and request.if_modified_since and http_date(last_modified) <= request.if_modified_since)
+
+    if fresh:
+        return validated(Response(status=304), etag, last_modified)
+
+    return None
+
+
+def validated(response, etag, last_modified):
+    response.set_etag(etag)
+
+    if last_modified:
+        response.last_modified = http_date(last_modified)
+
+    return response
+
+
+def negotiated(response):
+    # Collections are JSON or NDJSON by the Accept header, caches keep them apart
+    response.vary.add('Accept')
+
+    return response
+
+
+def http_date(value):
+    return value.replace(microsecond=0, tzinfo=timezone.utc)
+
+
+def version_tag(value):
+    return value.strftime('%Y%m%d%H%M%S%f') if value else '0'
+
+
+def requested_fields(kind, value):
+    # A comma separated subset of the payload fields, all of them by default.
+    # Returned in the payload order, so equal subsets share an ETag
+    if not value:
+        return FIELDS[kind]
+
+    names = {name.strip() for name in value.split(',')} - {''}
+
+    if not names or names - set(FIELDS[kind]):
+        return None
+
+    return tuple(name for name in FIELDS[kind] if name == 'id' or name in names)
+
+
+def fields_tag(kind, fields):
+    return '' if fields == FIELDS[kind] else '-' + '.'.join(fields)
+
+
+def unknown_fields(kind):
+    return {'Error 400': f"Fields must be a comma separated list of: {', '.join(FIELDS[kind])}"}, 400
+
+
+def item_etag(kind, id, updated_at, fields):
+    return f"{kind}-{id}-{version_tag(updated_at)}{fields_tag(kind, fields)}"
+
+
+def collection_etag(kind, version, fields, ndjson, ids=None):
+    # Collections are versioned as a whole by a single table_version row
+    ids_tag = '-ids.' + hashlib.blake2s(','.join(map(str, ids)).encode(), digest_size=8).hexdigest() if ids else ''
+
+    return f"{kind}-{version.version if version else 0}{fields_tag(kind, fields)}{ids_tag}{'-ndjson' if ndjson else ''}"
+
+
+def cached_row(kind, id, updated_at):
+    # A cached row is served only while it is as recent as the database row
+    entry = cache.get((kind, id))
+
+    return entry[0] if entry and entry[1] == updated_at else None
+
+
+def item_response(kind, id, fields):
+    model = MODELS[kind]
+    token = cache.token()
+
+    # A primary key lookup of updated_at is enough to answer 304. It is done
+    # on every read, other processes write without invalidating this cache
+    found = database.session.query(model.updated_at).filter_by(id=id).first()
+
+    if found is None:
+        return None
+
+    updated_at = found.updated_at
+    etag = item_etag(kind, id, updated_at, fields)
+    response = not_modified(etag, updated_at)
+
+    if response:
+        return response
+
+    row = cached_row(kind, id, updated_at)
+
+    # Only rows of whole payloads are cached, a subset is written out of a cached one
+    if row is None:
+        rows = select_rows(kind, model.query.filter_by(id=id), fields)
+
+        if not rows:
+            return None
+
+        row, selected = rows[0], fields
+
+        if fields == FIELDS[kind]:
+            cache.set((kind, id), (row, updated_at), token)
+    else:
+        selected = FIELDS[kind]
+
+    [(_, payload)] = encode_rows(kind, [row], fields, selected)
+
+    return validated(json_response(payload), etag, updated_at)
+
+
+def filter_books(query, args):
+    # Every filter is a WHERE clause served by an index of book or books_authors
+    if args['price_min'] is not None:
+        query = query.filter(Book.price >= args['price_min'])
+
+    if args['price_max'] is not None:
+        query = query.filter(Book.price <= args['price_max'])
+
+    if args['premiere_from'] is not None:
+        query = query.filter(Book.premiere >= args['premiere_from'])
+
+    if args['premiere_to'] is not None:
+        query = query.filter(Book.premiere <= args['premiere_to'])
+
+    if args['author_id'] is not None:
+        query = query.filter(Book.id.in_(
+            database.session.query(books_authors.c.book_id).filter(books_authors.c.author_id == args['author_id'])
+        ))
+
+    if args['client_id'] is not None:
+        query = query.filter(Book.client_id == args['client_id'])
+
+    if args['available'] is not None:
+        query = query.filter(Book.client_id.is_(None) if args['available'] else Book.client_id.isnot(None))
+
+    return query.order_by(*BOOK_SORTS[args['sort'] or 'id'])
+
+
+def collection_request(kind, parser):
+    # The arguments, fields and format of a collection request, or the error
+    # it is answered with
+    args = parser.parse_args()
+    ndjson = wants_ndjson(args)
+    fields = requested_fields(kind, args['fields'])
+
+    if fields is None:
+        return None, None, None, unknown_fields(kind)
+
+    # Pages and streams seek on the primary key, so they keep the id order
+    if args.get('sort') not in (None, 'id') and (ndjson or args['limit'] or args['after_id'] is not None):
+        return None, None, None, ({'Error 400': "Sorting is not supported with limit, after_id or NDJSON"}, 400)
+
+    # A list of ids is read as it is, without filters, sorting or pages
+    others = [name for name, value in args.items() if value is not None and name not in ('ids', 'fields', 'format')]
+
+    if args['ids'] is not None and (ndjson or others):
+        return None, None, None, ({'Error 400': "ids can only be combined with fields"}, 400)
+
+    return args, fields, ndjson, None
+
+
+def collection(kind, serialize, parser=collection_args, refine=None):
+    args, fields, ndjson, error = collection_request(kind, parser)
+
+    if error:
+        return error
+
+    version = collection_version(kind)
+    updated_at = version.updated_at if version else None
+    etag = collection_etag(kind, version, fields, ndjson, args['ids'])
+    response = not_modified(etag, updated_at)
+
+    if response:
+        return negotiated(response)
+
+    return negotiated(validated(listing(kind, serialize, args, ndjson, refine, fields), etag, updated_at))
+
+
+def listing(kind, serialize, args, ndjson, refine, fields):
+    model = MODELS[kind]
+    query = refine(model.query, args) if refine else model.query
+
+    if ndjson:
+        return stream(model, serialize, query, args['after_id'] or 0, args['limit'], fields)
+
+    if args['ids'] is not None:
+        return ids_response(args['ids'], serialize(query.filter(model.id.in_(args['ids'])), fields))
+
+    if args['limit'] is None and args['after_id'] is None:
+        return json_array(encode_batches(kind, query, fields, current_app.config['STREAM_BATCH_SIZE']))
+
+    query, limit = page_query(model, query, args)
+
+    return page_response(serialize(query, fields), limit)
+
+
+def page_query(model, query, args):
+    # Keyset pagination: seek past the cursor on the primary key index,
+    # one extra row tells if there is a next page
+    limit = min(args['limit'] or current_app.config['PAGE_LIMIT'], current_app.config['PAGE_LIMIT_MAX'])
+    query = query.filter(model.id > (args['after_id'] or 0)).order_by(None).order_by(model.id).limit(limit + 1)
+
+    return query, limit
+
+
+def ids_response(ids, items):
+    # Items follow the order of the requested ids, the ids not found are listed apart
+    found = dict(items)
+
+    return json_response(encode_ids(
+        [(id, found[id]) for id in ids if id in found], [id for id in ids if id not in found]
+    ))
+
+
+def page_response(items, limit):
+    next_id = items[limit - 1][0] if len(items) > limit else None
+
+    return json_response(encode_page(items[:limit], next_id))
+
+
+def delete_all(kind, unlink, column, **related):
+    # unlink drops the references to the deleted rows, column limits it to a chunk
+    # and related maps the collections whose payloads embed the deleted rows to
+    # their (id column, column of the deleted ids) pair
+    args = delete_args.parse_args()
+    chunk_size = args['chunk_size'] or current_app.config['DELETE_CHUNK_SIZE']
+    model = MODELS[kind]
+    table = model.__table__
+
+    if not chunk_size:
+        database.session.execute(unlink)
+        database.session.execute(table.delete())
+        mark_changed(**{kind: ALL}, **{name: ALL for name in related})
+        database.session.commit()
+        return
+
+    # Chunked mode commits after every chunk, so locks are held only briefly.
+    # Each commit marks the rows of its own chunk changed, a delete that stops
+    # halfway included, and none of the rows left for the next chunks
+    while True:
+        ids = [id for id, in database.session.query(model.id).order_by(model.id).limit(chunk_size)]
+
+        if not ids:
+            break
+
+        changed = {
+            name: {id for id, in database.session.execute(select(id_column).where(owner.in_(ids)))}
+            for name, (id_column, owner) in related.items()
+        }
+        database.session.execute(unlink.where(column.in_(ids)))
+        database.session.execute(table.delete().where(table.c.id.in_(ids)))
+        mark_changed(**{kind: ids}, **changed)
+        names.forget_all()
+        database.session.commit()
+
+        if len(ids) < chunk_size:
+            break
+
+
 def check_author(name, create=False):
     name = name.strip().split(' ')
 
     if len(name) > 1:
-        author = Author.query.filter_by(first_name=name[0], last_name=name[1]).first()
+        author = names.find(Author, first_name=name[0], last_name=name[1])
 
         # Create book's author if not exist in database   
         if not author and create:
-            author = Author(first_name=name[0], last_name=name[1])
-            database.session.add(author)
-            database.session.commit()
+            author = names.create(Author, first_name=name[0], last_name=name[1])
         elif not author:
             author = False
 
@@ -48,13 +455,11 @@ def check_author(name, create=False):
 
 def check_book(title, create=False):
     if len(title) > 1:
-        book = Book.query.filter_by(title=title).first()
+        book = names.find(Book, title=title)
 
         # Create a book if not exist in database   
         if not book and create:
-            book = Book(title=title)
-            database.session.add(book)
-            database.session.commit()
+            book = names.create(Book, title=title)
         elif not book:
             book = False
 
@@ -67,13 +472,11 @@ def check_client(name, create=False):
     name = name.strip().split(' ')
 
     if len(name) > 1:
-        client = Client.query.filter_by(first_name=name[0], last_name=name[1]).first()
+        client = names.find(Client, first_name=name[0], last_name=name[1])
 
         # Create book's client if not exist in database   
         if not client and create:
-            client = Client(first_name=name[0], last_name=name[1])
-            database.session.add(client)
-            database.session.commit()
+            client = names.create(Client, first_name=name[0], last_name=name[1])
         elif not client:
             client = False
 
@@ -82,26 +485,324 @@ def check_client(name, create=False):
         return False
 
 
-@api.route('/books')
-class BooksAll(Resource):
+def patch_columns(row, form, names):
+    # Only the fields whose value differs are set, so an unchanged row is
+    # never updated. Returns the names of the changed fields
+    changed = list()
 
-    def get(self):
-        books       = Book.query.all()
-        books_list  = list()
+    for name in names:
+        value = add_value_from_form(form, name, getattr(row, name))
 
-        for book in books:
-            authors = [{'name': f"{author.first_name} {author.last_name}", 'id': author.id} for author in book.authors]
+        if value != getattr(row, name):
+            setattr(row, name, value)
+            changed.append(name)
 
-            book = {
-                'id': book.id, 'title': book.title, 'premiere': book.premiere,
-                'price': book.price, 'authors': authors, 'client_id': book.client_id
-            }
+    return changed
 
-            books_list.append(book)
-        
-        return jsonify(books_list)
 
-    @api.expect(api.model('Book', Book.FIELDS), validate=True)
+def link_changes(form, name):
+    # PATCH changes an association with {"add": [...], "remove": [...]}
+    changes = form.get(name) or dict()
+
+    return changes.get('add') or [], changes.get('remove') or []
+
+
+def patch_links(column, other, owner_id, add, remove, replace=False):
+    # Inserts and deletes only the books_authors rows that change. With replace
+    # every link missing from add is removed. Returns the ids linked before
+    # and the ids whose link changed
+    linked = {id for id, in database.session.query(other).filter(column == owner_id)}
+    add = set(add)
+    removed = (linked if replace else set(remove) & linked) - add
+    added = add - linked
+
+    if added:
+        database.session.execute(books_authors.insert(), [{column.key: owner_id, other.key: id} for id in added])
+
+    if removed:
+        database.session.execute(books_authors.delete().where(column == owner_id, other.in_(removed)))
+
+    return linked, added | removed
+
+
+def lend_books(client_id, add, remove, replace=False):
+    # Updates client_id of the books whose client changes only. Returns the
+    # books held before, the changed books and the clients they were taken from
+    table = Book.__table__
+    held = {id for id, in database.session.query(Book.id).filter(Book.client_id == client_id)}
+    add = set(add)
+    removed = (held if replace else set(remove) & held) - add
+    added = add - held
+    owners = set()
+
+    if added:
+        owners = {id for id, in database.session.query(Book.client_id).filter(Book.id.in_(added))}
+        database.session.execute(table.update().where(table.c.id.in_(added)).values(client_id=client_id))
+
+    if removed:
+        database.session.execute(table.update().where(table.c.id.in_(removed)).values(client_id=None))
+
+    return held, added | removed, owners
+
+
+def change_book(book, form, add, remove, replace=False):
+    # Applies the differing fields and links of a PUT or PATCH form and commits
+    # them, a form that changes nothing writes nothing. Returns the names of
+    # the changed fields and the error response, if any
+    title = add_value_from_form(form, 'title', book.title)
+
+    if title != book.title and Book.query.filter_by(title=title).first():
+        return None, ({'Error 409': "The book is already in database"}, 409)
+
+    authors = [check_author(name, True) for name in add]
+    name = add_value_from_form(form, 'client')
+    client = check_client(name, True) if name else None
+
+    if not all(authors) or client is False:
+        return None, ({'Error 400': "Names need a first and a last name"}, 400)
+
+    removed = [author.id for author in map(check_author, remove) if author]
+    old_title, old_client = book.title, book.client_id
+    changed = patch_columns(book, form, ('title', 'premiere', 'price'))
+
+    if 'title' in changed:
+        names.forget(Book, title=old_title)
+
+    if client and client.id != book.client_id:
+        book.client_id = client.id
+        changed.append('client')
+
+    linked, relinked = patch_links(
+        books_authors.c.book_id, books_authors.c.author_id, book.id, [author.id for author in authors], removed, replace
+    )
+
+    if relinked:
+        changed.append('authors')
+
+    if changed:
+        # Authors and clients embed the title of their books
+        mark_changed(
+            books=[book.id],
+            authors=relinked | linked if 'title' in changed else relinked,
+            clients={old_client, book.client_id} if {'title', 'client'} & set(changed) else ()
+        )
+        database.session.commit()
+
+    return changed, None
+
+
+def change_author(author, form, add, remove, replace=False):
+    first_name = add_value_from_form(form, 'first_name', author.first_name)
+    last_name = add_value_from_form(form, 'last_name', author.last_name)
+
+    if (first_name, last_name) != (author.first_name, author.last_name) and \
+            Author.query.filter_by(first_name=first_name, last_name=last_name).first():
+        return None, ({'Error 409': "The author is already in database"}, 409)
+
+    books = [check_book(title, True) for title in add]
+
+    if not all(books):
+        return None, ({'Error 400': "Titles need at least 2 characters"}, 400)
+
+    removed = [book.id for book in map(check_book, remove) if book]
+    old_name = {'first_name': author.first_name, 'last_name': author.last_name}
+    changed = patch_columns(author, form, ('first_name', 'last_name', 'birth', 'death'))
+    renamed = {'first_name', 'last_name'} & set(changed)
+
+    if renamed:
+        names.forget(Author, **old_name)
+
+    linked, relinked = patch_links(
+        books_authors.c.author_id, books_authors.c.book_id, author.id, [book.id for book in books], removed, replace
+    )
+
+    if relinked:
+        changed.append('books')
+
+    if changed:
+        # Books embed the names of their authors
+        mark_changed(books=relinked | linked if renamed else relinked, authors=[author.id])
+        database.session.commit()
+
+    return changed, None
+
+
+def change_client(client, form, add, remove, replace=False):
+    first_name = add_value_from_form(form, 'first_name', client.first_name)
+    last_name = add_value_from_form(form, 'last_name', client.last_name)
+
+    if (first_name, last_name) != (client.first_name, client.last_name) and \
+            Client.query.filter_by(first_name=first_name, last_name=last_name).first():
+        return None, ({'Error 409': "The client is already in database"}, 409)
+
+    books = [check_book(title, True) for title in add]
+
+    if not all(books):
+        return None, ({'Error 400': "Titles need at least 2 characters"}, 400)
+
+    removed = [book.id for book in map(check_book, remove) if book]
+    old_name = {'first_name': client.first_name, 'last_name': client.last_name}
+    changed = patch_columns(client, form, ('first_name', 'last_name'))
+
+    if changed:
+        names.forget(Client, **old_name)
+
+    held, lent, owners = lend_books(client.id, [book.id for book in books], removed, replace)
+
+    if lent:
+        changed.append('books')
+
+    if changed:
+        mark_changed(books=lent, clients=owners | {client.id})
+        database.session.commit()
+
+    return changed, None
+
+
+def split_name(name):
+    name = name.strip().split(' ')
+
+    if len(name) > 1:
+        return name[0], name[1]
+
+    return None
+
+
+def people_ids(model, pairs):
+    # Find every named author or client with chunked (first, last) IN queries
+    ids = dict()
+
+    for start in range(0, len(pairs), IN_CHUNK):
+        rows = database.session.query(model.id, model.first_name, model.last_name).filter(
+            tuple_(model.first_name, model.last_name).in_(pairs[start:start + IN_CHUNK])
+        )
+
+        for id, first_name, last_name in rows:
+            ids.setdefault((first_name, last_name), id)
+
+    return ids
+
+
+def resolve_people(model, people):
+    # Insert the missing authors or clients at once and read their ids back,
+    # returning a name -> id map. Names inserted meanwhile by another request
+    # are skipped by the unique name index, as names.create does
+    pairs = list(set(people))
+    ids = people_ids(model, pairs)
+    missing = [pair for pair in pairs if pair not in ids]
+
+    if missing:
+        names.create_all(model, [{'first_name': first, 'last_name': last} for first, last in missing])
+        ids.update(people_ids(model, missing))
+
+    return ids
+
+
+def import_books(items, seen_titles):
+    results = dict()
+    valid = list()
+
+    # Validate every item the same way as POST /books
+    for index, form in items:
+        if form is INVALID_LINE:
+            results[index] = {'index': index, 'status': 400, 'Error 400': "Invalid JSON"}
+            continue
+
+        error = next(book_validator.iter_errors(form), None)
+
+        if error:
+            results[index] = {'index': index, 'status': 400, 'Error 400': error.message}
+            continue
+
+        authors = [split_name(name) for name in form.get('authors') or []]
+        client = form.get('client')
+        client = split_name(client) if isinstance(client, str) else client
+
+        if None in authors or (client is not None and not isinstance(client, tuple)):
+            results[index] = {'index': index, 'status': 400, 'Error 400': "Invalid author or client name"}
+            continue
+
+        valid.append((index, form, list(dict.fromkeys(authors)), client))
+
+    # Resolve authors and clients for the whole batch at once
+    author_ids = resolve_people(Author, [name for _, _, authors, _ in valid for name in authors])
+    client_ids = resolve_people(Client, [client for _, _, _, client in valid if client])
+    books = list()
+
+    for index, form, authors, client in valid:
+        if form['title'] in seen_titles:
+            results[index] = {'index': index, 'status': 409, 'Error 409': "The book is already in database"}
+            continue
+
+        seen_titles.add(form['title'])
+        books.append((index, authors, {
+            'title':        add_value_from_form(form, 'title'),
+            'premiere':     add_value_from_form(form, 'premiere'),
+            'price':        add_value_from_form(form, 'price'),
+            'client_id':    client_ids[client] if client else None
+        }))
+
+    # The unique title index skips the books stored already, by this request
+    # or a concurrent one, the ids of the inserted ones are read back
+    inserted = dict(names.create_all(Book, [row for _, _, row in books], Book.title, Book.id))
+    links = [
+        {'book_id': inserted[row['title']], 'author_id': author_ids[name]}
+        for _, authors, row in books if row['title'] in inserted for name in authors
+    ]
+
+    if links:
+        database.session.execute(books_authors.insert(), links)
+
+    for index, _, row in books:
+        if row['title'] in inserted:
+            results[index] = {'index': index, 'status': 201, 'added': row['title'], 'id': inserted[row['title']]}
+        else:
+            results[index] = {'index': index, 'status': 409, 'Error 409': "The book is already in database"}
+
+    changed_authors = {link['author_id'] for link in links}
+    changed_clients = {row['client_id'] for _, _, row in books if row['title'] in inserted and row['client_id']}
+
+    return [results[index] for index, _ in items], changed_authors, changed_clients
+
+
+def parse_line(line):
+    # A line that is not JSON fails alone, as an item that is not valid
+    try:
+        return json.loads(line)
+    except ValueError:
+        return INVALID_LINE
+
+
+def read_bulk_items():
+    # NDJSON bodies are read line by line, anything else must be a JSON array.
+    # Returns the items or the error response of the body
+    if request.mimetype == NDJSON:
+        lines = (line for line in request.stream if line.strip())
+        return enumerate(parse_line(line) for line in lines), None
+
+    items = request.get_json(silent=True)
+
+    if items is None:
+        return None, ({'Error 400': "Invalid JSON in request body"}, 400)
+
+    if not isinstance(items, list):
+        return None, ({'Error 400': "Expected an array of books"}, 400)
+
+    return enumerate(items), None
+
+
+book_model = api.model('Book', Book.FIELDS)
+book_validator = Draft4Validator(book_model.__schema__)
+
+
+@api.route('/books')
+class BooksAll(Resource):
+
+    @api.expect(book_args)
+    def get(self):
+        return collection('books', serialize_books, book_args, filter_books)
+
+    @api.expect(book_model, validate=True)
     def post(self):
         form = request.get_json()
 
@@ -118,11 +819,17 @@ class BooksAll(Resource):
 
         # Add authors to the book from database
         authors_book = add_value_from_form(form, 'authors')
+        changed_authors = set()
+        changed_clients = set()
 
         if authors_book:
             for name in authors_book:
                 author = check_author(name, True)
-                book.authors.append(author)
+
+                # Each author is linked to the book only once
+                if author not in book.authors:
+                    book.authors.append(author)
+                    changed_authors.add(author.id)
 
         # Add client
         name = add_value_from_form(form, 'client')
@@ -132,22 +839,22 @@ class BooksAll(Resource):
 
             if client:
                 client.books.append(book)
+                changed_clients.add(client.id)
 
         # Add the book to database
         database.session.add(book)
+        database.session.flush()
+        mark_changed(books=[book.id], authors=changed_authors, clients=changed_clients)
         database.session.commit()
 
         return {'added': book.title}, 201
 
+    @api.expect(delete_args)
     def delete(self):
-        books = Book.query.all()
-
-        for book in books:
-            book.authors = []
-            database.session.commit()
-            database.session.delete(book)
-
-        database.session.commit()
+        delete_all(
+            'books', books_authors.delete(), books_authors.c.book_id,
+            authors=(books_authors.c.author_id, books_authors.c.book_id), clients=(Book.client_id, Book.id)
+        )
 
         return {'deleted': 'all books'}, 200
 
@@ -155,52 +862,48 @@ class BooksAll(Resource):
 @api.route('/books/<int:id>')
 class BooksById(Resource):
 
+    @api.expect(fields_args)
     def get(self, id):
-        book = Book.query.get(id)
+        fields = requested_fields('books', fields_args.parse_args()['fields'])
 
-        if book:
-            authors = [{'name': f"{author.first_name} {author.last_name}", 'id': author.id} for author in book.authors]
+        if fields is None:
+            return unknown_fields('books')
 
-            return jsonify({
-                'id': book.id, 'title': book.title, 'premiere': book.premiere,
-                'price': book.price, 'authors': authors, 'client_id': book.client_id
-            })
+        response = item_response('books', id, fields)
+
+        if response:
+            return response
         
         return {'Error': 'Book is not find'}, 404
 
     def put(self, id):
         book = Book.query.get(id)
-        before_change = book
         form = request.get_json()
 
         if book:
-            book.title = add_value_from_form(form, 'title', book.title)
-            book.premiere = add_value_from_form(form, 'premiere', book.premiere)
-            book.price = add_value_from_form(form, 'price', book.price)
+            # A list replaces the authors, only the links that differ are written
             authors = add_value_from_form(form, 'authors')
-            client = add_value_from_form(form, 'client')
+            _, error = change_book(book, form, authors or [], [], replace=bool(authors))
 
-            # Check authors
-            if authors:
-                aut = list()
+            if error:
+                return error
 
-                for name in authors:
-                    author = check_author(name, True)
-                    aut.append(author)
+            return {'modified': book.title}, 200
 
-                if aut:
-                    book.authors = aut
+        return {'Error': 'Book is not find'}, 404
 
-            # Check client
-            if client:
-                client = check_client(client, True)                
-                book.client_id = client.id
+    @api.expect(book_changes, validate=True)
+    def patch(self, id):
+        book = Book.query.get(id)
+        form = request.get_json()
 
-            # Update the book in database
-            database.session.add(book)
-            database.session.commit()
+        if book:
+            changed, error = change_book(book, form, *link_changes(form, 'authors'))
+
+            if error:
+                return error
 
-            return {'modified': f"{before_change.title}"}, 200
+            return {'modified': book.title, 'changed': changed}, 200
 
         return {'Error': 'Book is not find'}, 404
 
@@ -208,9 +911,13 @@ class BooksById(Resource):
         book = Book.query.get(id)
 
         if book:
+            changed_authors = [author.id for author in book.authors]
+            changed_clients = [book.client_id]
             book.authors= []
-            database.session.commit()
+            database.session.flush()
             database.session.delete(book)
+            names.forget(Book, title=book.title)
+            mark_changed(books=[id], authors=changed_authors, clients=changed_clients)
             database.session.commit()
 
             return {'deleted': f"{book.title}"}, 200
@@ -218,22 +925,64 @@ class BooksById(Resource):
         return {'Error': 'Book is not find'}, 404
         
 
-@api.route('/authors')
-class AuthorsAll(Resource):
+@api.route('/books/bulk')
+class BooksBulk(Resource):
+
+    @api.expect([book_model])
+    def post(self):
+        items, error = read_bulk_items()
+
+        if error:
+            return error
+
+        batch_size = current_app.config['BULK_BATCH_SIZE']
+        seen_titles = set()
+        results = list()
+
+        # One commit per batch of books
+        while batch := list(islice(items, batch_size)):
+            batch_results, changed_authors, changed_clients = import_books(batch, seen_titles)
+            added = [result['id'] for result in batch_results if result['status'] == 201]
+            mark_changed(books=added, authors=changed_authors, clients=changed_clients)
+            database.session.commit()
+            results.extend(batch_results)
+
+        added = sum(result['status'] == 201 for result in results)
+
+        return {'added': added, 'results': results}, 200
+
+
+@api.route('/search')
+class Search(Resource):
+
+    @api.expect(search_args)
+    def get(self):
+        args = search_args.parse_args()
+        limit = min(args['limit'] or current_app.config['SEARCH_LIMIT'], current_app.config['PAGE_LIMIT_MAX'])
+
+        return jsonify(search(args['q'], args['type'] or list(INDEXES), limit))
+
+
+@api.route('/cache')
+class CacheStats(Resource):
 
     def get(self):
-        authors = Author.query.all()
-        authors_in_dict = list()
+        return cache.stats(), 200
+
 
-        for author in authors:
-            books = [{'title': book.title, 'id': book.id} for book in author.books]
+@api.route('/metrics')
+class RequestMetrics(Resource):
 
-            authors_in_dict.append({
-                'id': author.id, 'first_name': author.first_name, 'last_name': author.last_name,
-                'birth': author.birth, 'death': author.death, 'books': books
-            })
+    def get(self):
+        return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
 
-        return jsonify(authors_in_dict)
+
+@api.route('/authors')
+class AuthorsAll(Resource):
+
+    @api.expect(collection_args)
+    def get(self):
+        return collection('authors', serialize_authors)
 
     @api.expect(api.model('Author', Author.FIELDS), validate=True)
     def post(self):
@@ -252,26 +1001,30 @@ class AuthorsAll(Resource):
 
         # Add authors to the book from database
         authors_books = add_value_from_form(form, 'books')
+        changed_books = set()
 
         if authors_books:
             for title in authors_books:
                 book = check_book(title, True)
-                author.books.append(book)
+
+                # Each book is linked to the author only once
+                if book not in author.books:
+                    author.books.append(book)
+                    changed_books.add(book.id)
 
         database.session.add(author)
+        database.session.flush()
+        mark_changed(books=changed_books, authors=[author.id])
         database.session.commit()
 
         return {'added': str(author)}, 201
 
+    @api.expect(delete_args)
     def delete(self):
-        authors = Author.query.all()
-
-        for author in authors:
-            author.books = []
-            database.session.commit()
-            database.session.delete(author)
-
-        database.session.commit()
+        delete_all(
+            'authors', books_authors.delete(), books_authors.c.author_id,
+            books=(books_authors.c.book_id, books_authors.c.author_id)
+        )
 
         return {'deleted': 'all authors'}, 200
 
@@ -279,44 +1032,48 @@ class AuthorsAll(Resource):
 @api.route('/authors/<int:id>')
 class AuthorsById(Resource):
 
+    @api.expect(fields_args)
     def get(self, id):
-        author = Author.query.get(id)
+        fields = requested_fields('authors', fields_args.parse_args()['fields'])
 
-        if author:
-            books = [{'title': book.title, 'id': book.id} for book in author.books]
+        if fields is None:
+            return unknown_fields('authors')
+
+        response = item_response('authors', id, fields)
 
-            return jsonify({
-                    'id': author.id, 'first_name': author.first_name, 'last_name': author.last_name,
-                    'birth': author.birth, 'death': author.death, 'books': books
-                })
+        if response:
+            return response
 
         return {'Error': 'Author is not find'}, 404
 
     def put(self, id):
         author = Author.query.get(id)
-        before_change = author
         form = request.get_json()
 
         if author:
-            author.birth = add_value_from_form(form, 'birth', author.birth)
-            author.death = add_value_from_form(form, 'death', author.death)
-            author.first_name = add_value_from_form(form, 'first_name', author.first_name)
-            author.last_name = add_value_from_form(form, 'last_name', author.last_name)
+            # A list replaces the books, only the links that differ are written
             books = add_value_from_form(form, 'books')
-            boo = list()
+            _, error = change_author(author, form, books or [], [], replace=bool(books))
 
-            if books:
-                for title in books:
-                    book = check_book(title, True)
-                    boo.append(book)
+            if error:
+                return error
 
-                if boo:
-                    author.books = boo
+            return {'modified': f"{author.first_name} {author.last_name}"}, 200
 
-            database.session.add(author)
-            database.session.commit()
+        return {'Error': 'Author is not find'}, 404
 
-            return {'modified': f"{before_change.first_name} {before_change.last_name}"}, 200
+    @api.expect(author_changes, validate=True)
+    def patch(self, id):
+        author = Author.query.get(id)
+        form = request.get_json()
+
+        if author:
+            changed, error = change_author(author, form, *link_changes(form, 'books'))
+
+            if error:
+                return error
+
+            return {'modified': f"{author.first_name} {author.last_name}", 'changed': changed}, 200
 
         return {'Error': 'Author is not find'}, 404
 
@@ -324,9 +1081,12 @@ class AuthorsById(Resource):
         author = Author.query.get(id)
 
         if author:
+            changed_books = [book.id for book in author.books]
             author.books = []
-            database.session.commit()
+            database.session.flush()
             database.session.delete(author)
+            names.forget(Author, first_name=author.first_name, last_name=author.last_name)
+            mark_changed(books=changed_books, authors=[id])
             database.session.commit()
 
             return {'deleted': f"{author.first_name} {author.last_name}"}, 200
@@ -337,21 +1097,9 @@ class AuthorsById(Resource):
 @api.route('/clients')
 class ClientsAll(Resource):
 
+    @api.expect(collection_args)
     def get(self):
-        clients = Client.query.all()
-        clients_list = list()
-
-        for client in clients:
-            books = [{'title': book.title, 'id': book.id} for book in client.books]
-
-            client = {
-                'id': client.id, 'first_name': client.first_name, 'last_name': client.last_name,
-                'books': books
-            }
-
-            clients_list.append(client)
-
-        return jsonify(clients_list)
+        return collection('clients', serialize_clients)
 
     @api.expect(api.model('Client', Client.FIELDS), validate=True)
     def post(self):
@@ -368,27 +1116,30 @@ class ClientsAll(Resource):
 
         # Add books to the client
         books = add_value_from_form(form, 'books')
+        changed_books = set()
+        changed_clients = set()
+        database.session.add(client)
 
         if books:
             for title in books:
                 book = check_book(title, True)
+                changed_books.add(book.id)
+                changed_clients.add(book.client_id)
                 client.books.append(book)
 
         # Add the client to database
-        database.session.add(client)
+        database.session.flush()
+        mark_changed(books=changed_books, clients=changed_clients | {client.id})
         database.session.commit()
 
         return {'added': str(client)}, 201
 
+    @api.expect(delete_args)
     def delete(self):
-        clients = Client.query.all()
-
-        for client in clients:
-            client.books = []
-            database.session.commit()
-            database.session.delete(client)
-
-        database.session.commit()
+        delete_all(
+            'clients', Book.__table__.update().values(client_id=None), Book.__table__.c.client_id,
+            books=(Book.id, Book.client_id)
+        )
 
         return {'deleted': 'all clients'}, 200
 
@@ -396,42 +1147,48 @@ class ClientsAll(Resource):
 @api.route('/clients/<int:id>')
 class ClientsById(Resource):
 
+    @api.expect(fields_args)
     def get(self, id):
-        client  = Client.query.get(id)
+        fields = requested_fields('clients', fields_args.parse_args()['fields'])
 
-        if client:
-            books   = [{'title': book.title, 'id': book.id} for book in client.books]
+        if fields is None:
+            return unknown_fields('clients')
+
+        response = item_response('clients', id, fields)
 
-            return jsonify({
-                    'id': client.id, 'first_name': client.first_name, 'last_name': client.last_name,
-                    'books': books
-            })
+        if response:
+            return response
 
         return {'Error': 'Client is not find'}, 404
 
     def put(self, id):
         client = Client.query.get(id)
-        before_change = client
         form = request.get_json()
 
         if client:
-            client.first_name = add_value_from_form(form, 'first_name', client.first_name)
-            client.last_name = add_value_from_form(form, 'last_name', client.last_name)
+            # A list replaces the books, only the links that differ are written
             books = add_value_from_form(form, 'books')
-            boo = list()
+            _, error = change_client(client, form, books or [], [], replace=bool(books))
 
-            if books:
-                for title in books:
-                    book = check_book(title, True)
-                    boo.append(book)
+            if error:
+                return error
 
-                if boo:
-                    client.books = boo
+            return {'modified': f"{client.first_name} {client.last_name}"}, 200
 
-            database.session.add(client)
-            database.session.commit()
+        return {'Error': 'Client is not find'}, 404
 
-            return {'modified': f"{before_change.first_name} {before_change.last_name}"}, 200
+    @api.expect(client_changes, validate=True)
+    def patch(self, id):
+        client = Client.query.get(id)
+        form = request.get_json()
+
+        if client:
+            changed, error = change_client(client, form, *link_changes(form, 'books'))
+
+            if error:
+                return error
+
+            return {'modified': f"{client.first_name} {client.last_name}", 'changed': changed}, 200
 
         return {'Error': 'Client is not find'}, 404
 
@@ -439,9 +1196,12 @@ class ClientsById(Resource):
         client = Client.query.get(id)
 
         if client:
+            changed_books = [book.id for book in client.books]
             client.books = []
-            database.session.commit()
+            database.session.flush()
             database.session.delete(client)
+            names.forget(Client, first_name=client.first_name, last_name=client.last_name)
+            mark_changed(books=changed_books, clients=[id])
             database.session.commit()
 
             return {'deleted': f"{client.first_name} {client.last_name}"}, 200
@@ -0,0 +1,100 @@
+from sqlalchemy import DDL, event, func, or_, text
+import re
+
+from .models import Book, Author, Client
+from .models import database
+
+# Full-text index of every searchable table: name of the SQLite FTS5 table
+# and the indexed columns. The indexes use external content, so the text is
+# read from the tables themselves and triggers keep them in sync on every
+# INSERT, DELETE and UPDATE of an indexed column, whichever path issues it.
+INDEXES = {
+    'books': (Book, 'book_fts', ('title',)),
+    'authors': (Author, 'author_fts', ('first_name', 'last_name')),
+    'clients': (Client, 'client_fts', ('first_name', 'last_name')),
+}
+
+
+def index_ddl(table, fts, columns):
+    names = ', '.join(columns)
+    new = ', '.join(f"new.{column}" for column in columns)
+    old = ', '.join(f"old.{column}" for column in columns)
+
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({names}, content='{table}', "
+        f"content_rowid='id', tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_insert AFTER INSERT ON {table} BEGIN "
+        f"INSERT INTO {fts}(rowid, {names}) VALUES (new.id, {new}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_delete AFTER DELETE ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {names}) VALUES ('delete', old.id, {old}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_update AFTER UPDATE OF {names} ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {names}) VALUES ('delete', old.id, {old}); "
+        f"INSERT INTO {fts}(rowid, {names}) VALUES (new.id, {new}); END",
+    ]
+
+
+for model, fts, columns in INDEXES.values():
+    for statement in index_ddl(model.__tablename__, fts, columns):
+        event.listen(model.__table__, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
+
+    event.listen(
+        model.__table__, 'before_drop', DDL(f"DROP TABLE IF EXISTS {fts}").execute_if(dialect='sqlite')
+    )
+
+
+def include_object(object, name, type_, reflected, compare_to):
+    # Keep the FTS5 tables and their shadow tables out of autogenerate
+    return not (type_ == 'table' and reflected and compare_to is None and '_fts' in name)
+
+
+def terms(query):
+    return re.findall(r'\w+', query.lower())
+
+
+def fts_search(kind, words, limit):
+    _, fts, columns = INDEXES[kind]
+
+    # Every word must match, each one as a prefix, best bm25 rank first
+    match = ' '.join(f'"{word}"*' for word in words)
+    return database.session.execute(
+        text(f"SELECT rowid, {', '.join(columns)} FROM {fts} WHERE {fts} MATCH :match ORDER BY rank LIMIT :limit"),
+        {'match': match, 'limit': limit}
+    )
+
+
+def like_search(kind, words, limit):
+    model, _, columns = INDEXES[kind]
+    columns = [getattr(model, column) for column in columns]
+    length = sum((func.length(column) for column in columns[1:]), func.length(columns[0]))
+    query = database.session.query(model.id, *columns)
+
+    # Word prefixes with LIKE, shortest matching text ranks first
+    for word in words:
+        word = word.replace('_', '\\_')
+        query = query.filter(or_(*(
+            condition for column in columns for condition in (
+                func.lower(column).like(f"{word}%", escape='\\'),
+                func.lower(column).like(f"% {word}%", escape='\\')
+            )
+        )))
+
+    return query.order_by(length, model.id).limit(limit)
+
+
+def search(query, kinds, limit):
+    words = terms(query)
+    found = {kind: [] for kind in kinds}
+
+    if not words:
+        return found
+
+    engine = fts_search if database.session.get_bind().dialect.name == 'sqlite' else like_search
+
+    for kind in kinds:
+        for row in engine(kind, words, limit):
+            if kind == 'books':
+                found[kind].append({'id': row[0], 'title': row[1]})
+            else:
+                found[kind].append({'id': row[0], 'name': f"{row[1]} {row[2]}"})
+
+    return found
@@ -0,0 +1,174 @@
+from collections import defaultdict
+from functools import lru_cache
+from sqlalchemy import select, func, cast, Text
+
+from .models import Book, Author, Client
+from .models import database, books_authors
+from .metrics import timer
+from .encoders import compile_encoder, value_encoder, encode_json, encode_raw
+
+
+def authors_of_books(books):
+    # Authors of every selected book are fetched with one join on books_authors
+    book_ids = books.with_entities(Book.id)
+    rows = database.session.query(
+        books_authors.c.book_id, Author.id, Author.first_name, Author.last_name
+    ).join(
+        Author, Author.id == books_authors.c.author_id
+    ).filter(books_authors.c.book_id.in_(book_ids))
+
+    authors = defaultdict(list)
+
+    for book_id, author_id, first_name, last_name in rows:
+        authors[book_id].append({'name': f"{first_name} {last_name}", 'id': author_id})
+
+    return authors
+
+
+def books_of_authors(authors):
+    author_ids = authors.with_entities(Author.id)
+
+    return select(books_authors.c.author_id, Book.id, Book.title).join(
+        Book, Book.id == books_authors.c.book_id
+    ).where(books_authors.c.author_id.in_(author_ids))
+
+
+def books_of_clients(clients):
+    client_ids = clients.with_entities(Client.id)
+
+    return select(Book.client_id, Book.id, Book.title).where(Book.client_id.in_(client_ids))
+
+
+def group_books(rows):
+    # (owner id, book id, title) rows grouped by the author or client
+    books = defaultdict(list)
+
+    for owner_id, book_id, title in rows:
+        books[owner_id].append({'title': title, 'id': book_id})
+
+    return books
+
+
+# Fields of every payload, in the order they are selected. The id is always
+# part of a payload, pages and streams continue from it
+FIELDS = {
+    'books': ('id', 'title', 'premiere', 'price', 'authors', 'client_id'),
+    'authors': ('id', 'first_name', 'last_name', 'birth', 'death', 'books'),
+    'clients': ('id', 'first_name', 'last_name', 'books'),
+}
+
+PAYLOADS = {'books': Book, 'authors': Author, 'clients': Client}
+
+# Fields read as JSON text and written out unchanged. The authors of a book
+# come from the denormalized summary, the book table is read alone. The cast
+# reads text from every driver, psycopg2 would decode a json column
+JSON_COLUMNS = {
+    'books': {'authors': func.coalesce(cast(Book.authors_summary, Text), '[]')},
+    'authors': {},
+    'clients': {},
+}
+
+# Relationships are not columns, they are read with one more statement.
+# Each of them selects the books of the authors or clients of a query
+RELATED = {'authors': books_of_authors, 'clients': books_of_clients}
+
+
+def row_layout(fields):
+    # Rows hold the columns in the order of fields and the books last
+    return [name for name in fields if name != 'books'] + [name for name in fields if name == 'books']
+
+
+def field_encoder(kind, name):
+    if name in JSON_COLUMNS[kind]:
+        return encode_raw
+
+    if name == 'books':
+        return encode_json
+
+    return value_encoder(getattr(PAYLOADS[kind], name).type)
+
+
+@lru_cache(maxsize=None)
+def row_encoder(kind, fields, selected=None):
+    # Writes fields of rows read with the selected fields, keys are sorted
+    layout = row_layout(selected or fields)
+
+    return compile_encoder([(name, layout.index(name), field_encoder(kind, name)) for name in sorted(fields)])
+
+
+def row_statement(kind, query, fields):
+    # A Core select of the columns alone, no mapped object is ever built
+    columns = JSON_COLUMNS[kind]
+    names = [name for name in row_layout(fields) if name != 'books']
+
+    return query.with_entities(*(columns.get(name, getattr(PAYLOADS[kind], name)) for name in names)).statement
+
+
+def with_books(rows, books):
+    return [tuple(row) + (books.get(row[0], []),) for row in rows]
+
+
+def select_rows(kind, query, fields):
+    rows = database.session.execute(row_statement(kind, query, fields)).all()
+
+    if 'books' in fields:
+        rows = with_books(rows, group_books(database.session.execute(RELATED[kind](query))))
+
+    return rows
+
+
+def row_batches(kind, query, fields, size):
+    # Rows are fetched from an open cursor size at a time, so only a single
+    # batch of them is held in memory however many are selected
+    books = group_books(database.session.execute(RELATED[kind](query))) if 'books' in fields else None
+    result = database.session.execute(row_statement(kind, query, fields), execution_options={'yield_per': size})
+
+    for rows in result.partitions():
+        yield rows if books is None else with_books(rows, books)
+
+
+def encode_rows(kind, rows, fields, selected=None):
+    # Each row becomes an (id, JSON text) pair, the id leads every row
+    encode = row_encoder(kind, fields, selected)
+
+    with timer('serialize'):
+        return [(row[0], encode(row)) for row in rows]
+
+
+def encode_batches(kind, query, fields, size):
+    # Each batch of rows becomes one string of comma separated objects
+    for rows in row_batches(kind, query, fields, size):
+        items = encode_rows(kind, rows, fields)
+
+        if items:
+            with timer('serialize'):
+                chunk = ','.join(text for _, text in items)
+
+            yield chunk
+
+
+def encode_list(items):
+    with timer('serialize'):
+        return '[' + ','.join(text for _, text in items) + ']'
+
+
+def encode_page(items, next_id):
+    return f'{{"items":{encode_list(items)},"next":{"null" if next_id is None else next_id}}}'
+
+
+# Each serializer takes a query and issues a fixed number of statements
+# no matter how many rows it selects
+def serialize_books(books, fields=FIELDS['books']):
+    return encode_rows('books', select_rows('books', books, fields), fields)
+
+
+def serialize_authors(authors, fields=FIELDS['authors']):
+    return encode_rows('authors', select_rows('authors', authors, fields), fields)
+
+
+def serialize_clients(clients, fields=FIELDS['clients']):
+    return encode_rows('clients', select_rows('clients', clients, fields), fields)
+
+
+def encode_ids(items, missing):
+    return f'{{"items":{encode_list(items)},"missing":{encode_json(missing)}}}'
@@ -0,0 +1,47 @@
+import importlib.util
+
+from .models import database
+
+# Packages of the async application and its server
+ASYNC_PACKAGES = ('uvicorn', 'starlette', 'a2wsgi', 'aiosqlite', 'greenlet')
+
+
+def serve(app, bind, workers, threads):
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        raise RuntimeError("The production server needs gunicorn: pip install gunicorn")
+
+    class Server(BaseApplication):
+
+        def load_config(self):
+            self.cfg.set('bind', bind)
+            self.cfg.set('workers', workers)
+            self.cfg.set('threads', threads)
+            self.cfg.set('worker_class', 'gthread')
+            self.cfg.set('post_fork', post_fork)
+
+        def load(self):
+            return app
+
+    # Connections opened by the master before the fork are not shared with the workers
+    def post_fork(server, worker):
+        with app.app_context():
+            for engine in database.engines.values():
+                engine.dispose(close=False)
+
+    Server().run()
+
+
+def serve_async(bind, workers):
+    missing = [name for name in ASYNC_PACKAGES if importlib.util.find_spec(name) is None]
+
+    if missing:
+        raise RuntimeError(f"The async server needs {', '.join(missing)}: pip install {' '.join(missing)}")
+
+    import uvicorn
+
+    host, _, port = bind.rpartition(':')
+
+    # Every worker process builds its own application and async engine
+    uvicorn.run('library.asgi:create_application', factory=True, host=host, port=int(port), workers=workers)
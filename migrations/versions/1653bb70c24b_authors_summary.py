@@ -0,0 +1,52 @@
+"""authors summary
+
+Revision ID: 1653bb70c24b
+Revises: c914be6a0bc2
+Create Date: 2026-10-18 10:48:03.906412
+
+"""
+from collections import defaultdict
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1653bb70c24b'
+down_revision = 'c914be6a0bc2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('book', sa.Column('authors_summary', sa.JSON(), nullable=True))
+
+    # Backfill the summary of every book from books_authors
+    book = sa.table('book', sa.column('id', sa.Integer), sa.column('authors_summary', sa.JSON))
+    author = sa.table('author', sa.column('id'), sa.column('first_name'), sa.column('last_name'))
+    books_authors = sa.table('books_authors', sa.column('book_id'), sa.column('author_id'))
+
+    connection = op.get_bind()
+    summaries = defaultdict(list)
+    links = connection.execute(
+        sa.select(books_authors.c.book_id, author.c.id, author.c.first_name, author.c.last_name)
+        .join(author, author.c.id == books_authors.c.author_id)
+    )
+
+    for book_id, author_id, first_name, last_name in links:
+        summaries[book_id].append({'name': f"{first_name} {last_name}", 'id': author_id})
+
+    ids = [id for id, in connection.execute(sa.select(book.c.id))]
+    statement = book.update().where(book.c.id == sa.bindparam('book_id')).values(
+        authors_summary=sa.bindparam('summary')
+    )
+
+    for start in range(0, len(ids), 1000):
+        connection.execute(
+            statement, [{'book_id': id, 'summary': summaries.get(id, [])} for id in ids[start:start + 1000]]
+        )
+
+
+def downgrade():
+    with op.batch_alter_table('book') as batch_op:
+        batch_op.drop_column('authors_summary')
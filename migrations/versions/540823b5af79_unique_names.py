@@ -0,0 +1,35 @@
+"""unique names
+
+Revision ID: 540823b5af79
+Revises: 97e10e07f5c8
+Create Date: 2026-10-18 17:38:48.502434
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '540823b5af79'
+down_revision = '97e10e07f5c8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Fails if a name or title is already stored twice, such rows have to be merged first
+    op.drop_index('ix_author_name', table_name='author')
+    op.create_index('ix_author_name', 'author', ['first_name', 'last_name'], unique=True)
+    op.drop_index('ix_book_title', table_name='book')
+    op.create_index('ix_book_title', 'book', ['title'], unique=True)
+    op.drop_index('ix_client_name', table_name='client')
+    op.create_index('ix_client_name', 'client', ['first_name', 'last_name'], unique=True)
+
+
+def downgrade():
+    op.drop_index('ix_client_name', table_name='client')
+    op.create_index('ix_client_name', 'client', ['first_name', 'last_name'], unique=False)
+    op.drop_index('ix_book_title', table_name='book')
+    op.create_index('ix_book_title', 'book', ['title'], unique=False)
+    op.drop_index('ix_author_name', table_name='author')
+    op.create_index('ix_author_name', 'author', ['first_name', 'last_name'], unique=False)
@@ -0,0 +1,78 @@
+"""full text search
+
+Revision ID: 9b3be68049e8
+Revises: 1653bb70c24b
+Create Date: 2026-10-18 11:36:52.664079
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9b3be68049e8'
+down_revision = '1653bb70c24b'
+branch_labels = None
+depends_on = None
+
+# FTS5 tables of this revision, kept in sync with their tables by triggers
+FTS_TABLES = ('book_fts', 'author_fts', 'client_fts')
+
+STATEMENTS = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS book_fts USING fts5(title, content='book', "
+    "content_rowid='id', tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+    "CREATE TRIGGER IF NOT EXISTS book_fts_insert AFTER INSERT ON book BEGIN "
+    "INSERT INTO book_fts(rowid, title) VALUES (new.id, new.title); END",
+    "CREATE TRIGGER IF NOT EXISTS book_fts_delete AFTER DELETE ON book BEGIN "
+    "INSERT INTO book_fts(book_fts, rowid, title) VALUES ('delete', old.id, old.title); END",
+    "CREATE TRIGGER IF NOT EXISTS book_fts_update AFTER UPDATE OF title ON book BEGIN "
+    "INSERT INTO book_fts(book_fts, rowid, title) VALUES ('delete', old.id, old.title); "
+    "INSERT INTO book_fts(rowid, title) VALUES (new.id, new.title); END",
+
+    "CREATE VIRTUAL TABLE IF NOT EXISTS author_fts USING fts5(first_name, last_name, content='author', "
+    "content_rowid='id', tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+    "CREATE TRIGGER IF NOT EXISTS author_fts_insert AFTER INSERT ON author BEGIN "
+    "INSERT INTO author_fts(rowid, first_name, last_name) VALUES (new.id, new.first_name, new.last_name); END",
+    "CREATE TRIGGER IF NOT EXISTS author_fts_delete AFTER DELETE ON author BEGIN "
+    "INSERT INTO author_fts(author_fts, rowid, first_name, last_name) "
+    "VALUES ('delete', old.id, old.first_name, old.last_name); END",
+    "CREATE TRIGGER IF NOT EXISTS author_fts_update AFTER UPDATE OF first_name, last_name ON author BEGIN "
+    "INSERT INTO author_fts(author_fts, rowid, first_name, last_name) "
+    "VALUES ('delete', old.id, old.first_name, old.last_name); "
+    "INSERT INTO author_fts(rowid, first_name, last_name) VALUES (new.id, new.first_name, new.last_name); END",
+
+    "CREATE VIRTUAL TABLE IF NOT EXISTS client_fts USING fts5(first_name, last_name, content='client', "
+    "content_rowid='id', tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+    "CREATE TRIGGER IF NOT EXISTS client_fts_insert AFTER INSERT ON client BEGIN "
+    "INSERT INTO client_fts(rowid, first_name, last_name) VALUES (new.id, new.first_name, new.last_name); END",
+    "CREATE TRIGGER IF NOT EXISTS client_fts_delete AFTER DELETE ON client BEGIN "
+    "INSERT INTO client_fts(client_fts, rowid, first_name, last_name) "
+    "VALUES ('delete', old.id, old.first_name, old.last_name); END",
+    "CREATE TRIGGER IF NOT EXISTS client_fts_update AFTER UPDATE OF first_name, last_name ON client BEGIN "
+    "INSERT INTO client_fts(client_fts, rowid, first_name, last_name) "
+    "VALUES ('delete', old.id, old.first_name, old.last_name); "
+    "INSERT INTO client_fts(rowid, first_name, last_name) VALUES (new.id, new.first_name, new.last_name); END",
+]
+
+
+def upgrade():
+    # FTS5 indexes exist on SQLite only, other engines fall back to LIKE
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+
+    for statement in STATEMENTS:
+        op.execute(statement)
+
+    for fts in FTS_TABLES:
+        op.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+
+    for fts in FTS_TABLES:
+        for trigger in ('insert', 'delete', 'update'):
+            op.execute(f"DROP TRIGGER IF EXISTS {fts}_{trigger}")
+
+        op.execute(f"DROP TABLE IF EXISTS {fts}")
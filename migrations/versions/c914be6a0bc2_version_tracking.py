@@ -0,0 +1,50 @@
+"""version tracking
+
+Revision ID: c914be6a0bc2
+Revises: e439876e2aa9
+Create Date: 2026-10-18 10:02:17.530841
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c914be6a0bc2'
+down_revision = 'e439876e2aa9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('table_version',
+    sa.Column('name', sa.String(length=64), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+    op.add_column('author', sa.Column('updated_at', sa.DateTime(), nullable=True))
+    op.add_column('book', sa.Column('updated_at', sa.DateTime(), nullable=True))
+    op.add_column('client', sa.Column('updated_at', sa.DateTime(), nullable=True))
+
+    # Existing rows start as modified now
+    for table in ('author', 'book', 'client'):
+        op.execute(f"UPDATE {table} SET updated_at = CURRENT_TIMESTAMP")
+
+    op.execute(
+        "INSERT INTO table_version (name, version, updated_at) VALUES "
+        "('books', 1, CURRENT_TIMESTAMP), ('authors', 1, CURRENT_TIMESTAMP), ('clients', 1, CURRENT_TIMESTAMP)"
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('client') as batch_op:
+        batch_op.drop_column('updated_at')
+
+    with op.batch_alter_table('book') as batch_op:
+        batch_op.drop_column('updated_at')
+
+    with op.batch_alter_table('author') as batch_op:
+        batch_op.drop_column('updated_at')
+
+    op.drop_table('table_version')
@@ -0,0 +1,59 @@
+"""lookup indexes
+
+Revision ID: e439876e2aa9
+Revises: 1300c5292b61
+Create Date: 2026-10-18 09:12:40.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e439876e2aa9'
+down_revision = '1300c5292b61'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_author_name', 'author', ['first_name', 'last_name'], unique=False)
+    op.create_index('ix_client_name', 'client', ['first_name', 'last_name'], unique=False)
+    op.create_index(op.f('ix_book_title'), 'book', ['title'], unique=False)
+    op.create_index(op.f('ix_book_client_id'), 'book', ['client_id'], unique=False)
+
+    # books_authors gets a (book_id, author_id) primary key, the table is rebuilt
+    # so that repeated and incomplete links are dropped on the way
+    op.create_table('books_authors_new',
+    sa.Column('book_id', sa.Integer(), nullable=False),
+    sa.Column('author_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['author_id'], ['author.id'], ),
+    sa.ForeignKeyConstraint(['book_id'], ['book.id'], ),
+    sa.PrimaryKeyConstraint('book_id', 'author_id')
+    )
+    op.execute(
+        'INSERT INTO books_authors_new (book_id, author_id) '
+        'SELECT DISTINCT book_id, author_id FROM books_authors '
+        'WHERE book_id IS NOT NULL AND author_id IS NOT NULL'
+    )
+    op.drop_table('books_authors')
+    op.rename_table('books_authors_new', 'books_authors')
+    op.create_index(op.f('ix_books_authors_author_id'), 'books_authors', ['author_id'], unique=False)
+
+
+def downgrade():
+    op.create_table('books_authors_old',
+    sa.Column('book_id', sa.Integer(), nullable=True),
+    sa.Column('author_id', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['author_id'], ['author.id'], ),
+    sa.ForeignKeyConstraint(['book_id'], ['book.id'], )
+    )
+    op.execute('INSERT INTO books_authors_old (book_id, author_id) SELECT book_id, author_id FROM books_authors')
+    op.drop_index(op.f('ix_books_authors_author_id'), table_name='books_authors')
+    op.drop_table('books_authors')
+    op.rename_table('books_authors_old', 'books_authors')
+
+    op.drop_index(op.f('ix_book_client_id'), table_name='book')
+    op.drop_index(op.f('ix_book_title'), table_name='book')
+    op.drop_index('ix_client_name', table_name='client')
+    op.drop_index('ix_author_name', table_name='author')
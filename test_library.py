@@ -1,7 +1,22 @@
-import unittest, faker, random
+import unittest, faker, random, json, importlib.util, os, tempfile
+from datetime import date
+from unittest.mock import patch
+from concurrent.futures import ThreadPoolExecutor
+from click.testing import CliRunner
 from flask_testing import TestCase
+from sqlalchemy import event, inspect, create_engine
 
 from library import database, app
+from library.cache import cache, name_index
+from library.metrics import metrics
+from library.search import like_search
+from library.models import Author, Book, utcnow
+from library.serializers import row_encoder
+from library import names
+from library.changes import bump_version, NAMES
+
+# Optional packages of the async application
+ASYNC_PACKAGES = ('starlette', 'a2wsgi', 'aiosqlite', 'greenlet', 'httpx')
 
 
 #================================================================
@@ -72,6 +87,9 @@ class TestLibrary(TestCase):
     #--------------------------------
     def setUp(self):
         database.create_all()
+        cache.clear()
+        name_index.clear()
+        metrics.clear()
 
     #--------------------------------
     def tearDown(self):
@@ -375,6 +393,939 @@ class TestLibrary(TestCase):
         response = self.client.delete("/clients/1")
         self.assertEqual(response.status_code, 404)
 
+#----------------------------------------------------------------
+
+    # Collect SQL statements sent while a request is handled
+    def sql_statements(self, method, url, **kwargs):
+        statements = list()
+        listener = lambda *args: statements.append(args[2])
+
+        event.listen(database.engine, 'before_cursor_execute', listener)
+        response = getattr(self.client, method)(url, **kwargs)
+        event.remove(database.engine, 'before_cursor_execute', listener)
+
+        return response, statements
+
+    # Count SQL statements sent while a request is handled
+    def count_queries(self, method, url, **kwargs):
+        response, statements = self.sql_statements(method, url, **kwargs)
+
+        return response, len(statements)
+
+    # Fail when a request sends more SQL statements than its budget
+    def assertQueryBudget(self, budget, method, url, **kwargs):
+        response, statements = self.sql_statements(method, url, **kwargs)
+
+        if len(statements) > budget:
+            self.fail(f"{method.upper()} {url} sent {len(statements)} statements, budget {budget}:\n" + '\n'.join(statements))
+
+        return response
+
+    # Listing books does not query authors book by book
+    def test_get_books_fixed_queries(self):
+        for book in list_of_books(5):
+            self.client.post("/books", json=book)
+
+        _, few_books = self.count_queries('get', "/books")
+
+        for book in list_of_books(25):
+            self.client.post("/books", json=book)
+
+        response, many_books = self.count_queries('get', "/books")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(few_books, many_books)
+
+    # Listing authors and clients does not query books row by row
+    def test_get_authors_clients_fixed_queries(self):
+        for client in list_of_clients(3):
+            self.client.post("/clients", json=client)
+
+        for book in list_of_books(3):
+            self.client.post("/books", json=book)
+
+        _, authors_queries = self.count_queries('get', "/authors")
+        _, clients_queries = self.count_queries('get', "/clients")
+
+        for client in list_of_clients(10):
+            self.client.post("/clients", json=client)
+
+        for book in list_of_books(10):
+            self.client.post("/books", json=book)
+
+        self.assertEqual(self.count_queries('get', "/authors")[1], authors_queries)
+        self.assertEqual(self.count_queries('get', "/clients")[1], clients_queries)
+
+    # Listed book keeps the by-id shape with its authors
+    def test_get_books_payload(self):
+        book = list_of_books(1)[0]
+        book['authors'] = ['Jan Kowalski', 'Anna Nowak']
+        self.client.post("/books", json=book)
+
+        listed = self.client.get("/books").json[0]
+        single = self.client.get("/books/1").json
+
+        self.assertEqual(listed, single)
+        self.assertEqual(
+            sorted(author['name'] for author in listed['authors']), ['Anna Nowak', 'Jan Kowalski']
+        )
+        self.assertEqual(
+            sorted(listed), ['authors', 'client_id', 'id', 'premiere', 'price', 'title']
+        )
+
+    # Page through books with a keyset cursor
+    def test_get_books_pages(self):
+        for book in list_of_books(25):
+            self.client.post("/books", json=book)
+
+        total   = len(self.client.get("/books").json)
+        ids     = list()
+        url     = "/books?limit=10"
+
+        while url:
+            page = self.client.get(url).json
+            ids.extend(book['id'] for book in page['items'])
+            url = f"/books?limit=10&after_id={page['next']}" if page['next'] else None
+
+        self.assertEqual(len(ids), total)
+        self.assertEqual(ids, sorted(set(ids)))
+
+    # Last page has no next cursor
+    def test_get_clients_last_page(self):
+        for client in list_of_clients(3):
+            self.client.post("/clients", json=client)
+
+        response = self.client.get("/clients?limit=10")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json['items']), 3)
+        self.assertIsNone(response.json['next'])
+
+    # Reject an invalid page size
+    def test_get_authors_invalid_limit(self):
+        response = self.client.get("/authors?limit=0")
+        self.assertEqual(response.status_code, 400)
+
+    # Stream books as NDJSON in several batches
+    def test_get_books_ndjson(self):
+        for book in list_of_books(10):
+            self.client.post("/books", json=book)
+
+        app.config['STREAM_BATCH_SIZE'] = 3
+        response = self.client.get("/books?format=ndjson")
+        app.config['STREAM_BATCH_SIZE'] = 1000
+
+        streamed = [json.loads(line) for line in response.data.decode().splitlines()]
+        listed = sorted(self.client.get("/books").json, key=lambda book: book['id'])
+
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        self.assertEqual(streamed, listed)
+
+    # Choose NDJSON through the Accept header
+    def test_get_authors_ndjson_accept(self):
+        for author in list_of_authors(3):
+            self.client.post("/authors", json=author)
+
+        response = self.client.get("/authors", headers={'Accept': 'application/x-ndjson'})
+
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        self.assertEqual(len(response.data.decode().splitlines()), 3)
+
+    # Collections vary by the Accept header, revalidated ones included
+    def test_collection_vary_accept(self):
+        self.client.post("/authors", json=list_of_authors(1)[0])
+
+        response = self.client.get("/authors", headers={'Accept': 'application/x-ndjson'})
+        not_modified = self.client.get("/authors", headers={'If-None-Match': self.client.get("/authors").headers['ETag']})
+
+        self.assertEqual(response.headers['Vary'], 'Accept')
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified.headers['Vary'], 'Accept')
+
+    # Import many books at once
+    def test_post_books_bulk(self):
+        books = list_of_books(20)
+        for index, book in enumerate(books):
+            book['title'] = f"{book['title']} {index}"
+        books[1]['authors'] = books[0]['authors']
+
+        response = self.client.post("/books/bulk", json=books)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json['added'], 20)
+        self.assertEqual(len(self.client.get("/books").json), 20)
+        self.assertEqual(
+            self.client.get("/books/2").json['authors'], self.client.get("/books/1").json['authors']
+        )
+
+    # Report duplicated and invalid books per item
+    def test_post_books_bulk_conflicts(self):
+        book = list_of_books(1)[0]
+        self.client.post("/books", json=book)
+
+        other = list_of_books(1)[0]
+        other['title'] = book['title'] + " II"
+        invalid = {'price': 10}
+
+        response = self.client.post("/books/bulk", json=[book, other, other, invalid])
+        statuses = [result['status'] for result in response.json['results']]
+
+        self.assertEqual(statuses, [409, 201, 409, 400])
+
+    # Import books sent as NDJSON in several batches
+    def test_post_books_bulk_ndjson(self):
+        books = list_of_books(7)
+        for index, book in enumerate(books):
+            book['title'] = f"{book['title']} {index}"
+
+        app.config['BULK_BATCH_SIZE'] = 3
+        response = self.client.post(
+            "/books/bulk", data="\n".join(json.dumps(book) for book in books),
+            content_type='application/x-ndjson'
+        )
+        app.config['BULK_BATCH_SIZE'] = 500
+
+        self.assertEqual(response.json['added'], 7)
+        self.assertEqual(len(self.client.get("/clients").json), len({tuple(book['client'].split(' ')[:2]) for book in books}))
+
+    # A malformed NDJSON line fails alone, the rest of its batch is imported
+    def test_post_books_bulk_ndjson_invalid_line(self):
+        response = self.client.post(
+            "/books/bulk", data='{"title": "N1"}\n{"title": \n{"title": "N2"}\n',
+            content_type='application/x-ndjson'
+        )
+        statuses = [result['status'] for result in response.json['results']]
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(statuses, [201, 400, 201])
+        self.assertEqual(sorted(book['title'] for book in self.client.get("/books").json), ['N1', 'N2'])
+
+    # A body that is not a JSON array is refused as a whole
+    def test_post_books_bulk_invalid_body(self):
+        response = self.client.post("/books/bulk", data='[{"title": ', content_type='application/json')
+        self.assertEqual(response.json, {'Error 400': "Invalid JSON in request body"})
+
+        response = self.client.post("/books/bulk", json={'title': 'Dune'})
+        self.assertEqual(response.json, {'Error 400': "Expected an array of books"})
+
+    # Lookup columns are indexed
+    def test_lookup_indexes(self):
+        inspector = inspect(database.engine)
+        indexes = lambda table: {tuple(index['column_names']) for index in inspector.get_indexes(table)}
+
+        self.assertIn(('first_name', 'last_name'), indexes('author'))
+        self.assertIn(('first_name', 'last_name'), indexes('client'))
+        self.assertTrue({('title',), ('client_id',)} <= indexes('book'))
+        self.assertIn(('author_id',), indexes('books_authors'))
+        self.assertEqual(
+            inspector.get_pk_constraint('books_authors')['constrained_columns'], ['book_id', 'author_id']
+        )
+
+    # Delete all books in chunks together with their author links
+    def test_delete_books_chunked(self):
+        for book in list_of_books(20):
+            self.client.post("/books", json=book)
+
+        response = self.client.delete("/books?chunk_size=7")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get("/books").json, [])
+        self.assertTrue(all(author['books'] == [] for author in self.client.get("/authors").json))
+
+    # A chunk stamps only the rows it deletes or unlinks, never the rows left for later chunks
+    def test_delete_authors_chunked_touches_chunk(self):
+        for index in range(20):
+            self.client.post("/books", json={'title': f"Book {index}", 'authors': [f"A{index} X", f"A{index + 1} X"]})
+
+        touched = list()
+        listener = lambda connection, cursor, statement, *args: statement.startswith("UPDATE") and touched.append(cursor.rowcount)
+
+        event.listen(database.engine, 'after_cursor_execute', listener)
+        self.client.delete("/authors?chunk_size=5")
+        event.remove(database.engine, 'after_cursor_execute', listener)
+
+        # Each book is unlinked twice at most: its summary and updated_at each time,
+        # plus the books, authors and names versions of the 5 chunks
+        self.assertLessEqual(sum(touched), 4 * 20 + 3 * 5)
+        self.assertTrue(all(book['authors'] == [] for book in self.client.get("/books").json))
+
+    # Deleting all authors empties the summaries with one statement, however many books there are
+    def test_delete_authors_empties_summaries(self):
+        for index in range(20):
+            self.client.post("/books", json={'title': f"Book {index}", 'authors': [f"A{index} X"]})
+
+        self.assertQueryBudget(9, 'delete', "/authors")
+        self.assertTrue(all(book['authors'] == [] for book in self.client.get("/books").json))
+
+    # Every committed chunk changes the version, a delete failing halfway included
+    def test_delete_books_chunked_failure(self):
+        for book in list_of_books(6):
+            self.client.post("/books", json=book)
+
+        etag = self.client.get("/books").headers['ETag']
+        self.client.get("/books/1")
+        deletes = list()
+
+        def fail_second_chunk(connection, cursor, statement, *args):
+            if statement.startswith("DELETE FROM book "):
+                deletes.append(statement)
+
+                if len(deletes) == 2:
+                    raise RuntimeError("chunk failed")
+
+        event.listen(database.engine, 'before_cursor_execute', fail_second_chunk)
+
+        try:
+            self.assertEqual(self.client.delete("/books?chunk_size=2").status_code, 500)
+        finally:
+            event.remove(database.engine, 'before_cursor_execute', fail_second_chunk)
+            database.session.rollback()
+
+        response = self.client.get("/books", headers={'If-None-Match': etag})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json), 4)
+        self.assertEqual(self.client.get("/books/1").status_code, 404)
+
+    # Deleting all authors drops their links to books
+    def test_delete_authors_unlinks_books(self):
+        for book in list_of_books(5):
+            self.client.post("/books", json=book)
+
+        self.client.delete("/authors")
+
+        self.assertEqual(self.client.get("/authors").json, [])
+        self.assertTrue(all(book['authors'] == [] for book in self.client.get("/books").json))
+
+    # Deleting all clients leaves their books without a client
+    def test_delete_clients_releases_books(self):
+        for book in list_of_books(5):
+            self.client.post("/books", json=book)
+
+        self.client.delete("/clients")
+
+        self.assertEqual(self.client.get("/clients").json, [])
+        self.assertTrue(all(book['client_id'] is None for book in self.client.get("/books").json))
+
+    # Second read of a book comes from the cache
+    def test_get_book_cached(self):
+        self.client.post("/books", json=list_of_books(1)[0])
+
+        hits = self.client.get("/cache").json['hits']
+        first, first_queries = self.count_queries('get', "/books/1")
+        response, queries = self.count_queries('get', "/books/1")
+
+        self.assertEqual(response.json, first.json)
+        self.assertEqual(queries, 1)
+        self.assertLess(queries, first_queries)
+        self.assertEqual(self.client.get("/cache").json['hits'], hits + 1)
+
+    # A book changed by another process is not served from this cache
+    def test_get_book_changed_elsewhere(self):
+        self.client.post("/books", json=list_of_books(1)[0])
+        etag = self.client.get("/books/1").headers['ETag']
+
+        # Written as another worker would, nothing is invalidated here
+        database.session.execute(Book.__table__.update().values(price=99, updated_at=utcnow()))
+        database.session.commit()
+        response = self.client.get("/books/1", headers={'If-None-Match': etag})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json['price'], 99)
+        self.assertNotEqual(response.headers['ETag'], etag)
+
+    # Renaming an author refreshes the cached books of the author
+    def test_put_author_invalidates_books(self):
+        book = list_of_books(1)[0]
+        book['authors'] = ['Jan Kowalski']
+        self.client.post("/books", json=book)
+        self.client.get("/books/1")
+
+        self.client.put("/authors/1", json={'first_name': 'Janusz'})
+
+        self.assertEqual(self.client.get("/books/1").json['authors'][0]['name'], 'Janusz Kowalski')
+
+    # Deleting a book refreshes its cached author and client
+    def test_delete_book_invalidates_relations(self):
+        book = list_of_books(1)[0]
+        self.client.post("/books", json=book)
+        self.client.get("/authors/1")
+        self.client.get("/clients/1")
+
+        self.client.delete("/books/1")
+
+        self.assertEqual(self.client.get("/books/1").status_code, 404)
+        self.assertEqual(self.client.get("/authors/1").json['books'], [])
+        self.assertEqual(self.client.get("/clients/1").json['books'], [])
+
+    # Cache keeps only the most recently used payloads
+    def test_cache_evictions(self):
+        for index, author in enumerate(list_of_authors(3)):
+            author['last_name'] += str(index)
+            self.client.post("/authors", json=author)
+
+        size, cache.size = cache.size, 2
+        evictions = cache.stats()['evictions']
+
+        for id in (1, 2, 3):
+            self.client.get(f"/authors/{id}")
+
+        stats = cache.stats()
+        cache.size = size
+
+        self.assertEqual(stats['size'], 2)
+        self.assertEqual(stats['evictions'], evictions + 1)
+
+    # Unchanged book answers 304 until it is modified
+    def test_get_book_not_modified(self):
+        self.client.post("/books", json=list_of_books(1)[0])
+
+        response = self.client.get("/books/1")
+        etag = response.headers['ETag']
+        not_modified = self.client.get("/books/1", headers={'If-None-Match': etag})
+
+        self.assertIn('Last-Modified', response.headers)
+        self.assertEqual(not_modified.status_code, 304)
+
+        self.client.put("/books/1", json={'price': 12.5})
+        modified = self.client.get("/books/1", headers={'If-None-Match': etag})
+
+        self.assertEqual(modified.status_code, 200)
+        self.assertNotEqual(modified.headers['ETag'], etag)
+
+    # Revalidating a collection does not serialize it
+    def test_get_books_not_modified(self):
+        for book in list_of_books(5):
+            self.client.post("/books", json=book)
+
+        etag = self.client.get("/books").headers['ETag']
+        response, queries = self.count_queries('get', "/books")
+        self.assertEqual(response.status_code, 200)
+
+        response, conditional_queries = self.count_queries('get', "/books", headers={'If-None-Match': etag})
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(conditional_queries, 1)
+        self.assertLess(conditional_queries, queries)
+
+    # Renaming an author changes the version of the book listings
+    def test_put_author_changes_books_etag(self):
+        book = list_of_books(1)[0]
+        book['authors'] = ['Jan Kowalski']
+        self.client.post("/books", json=book)
+
+        books_etag = self.client.get("/books").headers['ETag']
+        book_etag = self.client.get("/books/1").headers['ETag']
+
+        self.client.put("/authors/1", json={'last_name': 'Nowak'})
+
+        self.assertEqual(self.client.get("/books", headers={'If-None-Match': books_etag}).status_code, 200)
+        self.assertEqual(self.client.get("/books/1", headers={'If-None-Match': book_etag}).status_code, 200)
+
+    # Deleting a book changes the version of the collection
+    def test_delete_book_changes_etag(self):
+        for book in list_of_books(2):
+            self.client.post("/books", json=book)
+
+        etag = self.client.get("/books").headers['ETag']
+        self.client.delete("/books/1")
+
+        self.assertEqual(self.client.get("/books", headers={'If-None-Match': etag}).status_code, 200)
+
+    # Listing books reads the book table alone
+    def test_get_books_single_table(self):
+        for book in list_of_books(5):
+            self.client.post("/books", json=book)
+
+        response, statements = self.sql_statements('get', "/books")
+
+        self.assertTrue(all(book['authors'] for book in response.json))
+        self.assertFalse(any('books_authors' in statement for statement in statements))
+
+    # Summary follows added, renamed and deleted authors
+    def test_authors_summary_follows_authors(self):
+        book = list_of_books(1)[0]
+        book['authors'] = ['Jan Kowalski']
+        self.client.post("/books", json=book)
+
+        self.client.post("/authors", json={'first_name': 'Anna', 'last_name': 'Nowak', 'books': [book['title']]})
+        self.client.put("/authors/1", json={'first_name': 'Janusz'})
+        names = sorted(author['name'] for author in self.client.get("/books/1").json['authors'])
+        self.assertEqual(names, ['Anna Nowak', 'Janusz Kowalski'])
+
+        self.client.delete("/authors/2")
+        self.assertEqual(self.client.get("/books/1").json['authors'], [{'id': 1, 'name': 'Janusz Kowalski'}])
+
+        self.client.delete("/authors")
+        self.assertEqual(self.client.get("/books/1").json['authors'], [])
+
+    # Consistency check finds and rebuilds a stale summary
+    def test_check_authors_summary(self):
+        self.client.post("/books", json=list_of_books(1)[0])
+        database.session.execute(database.text("UPDATE book SET authors_summary = '[]'"))
+        database.session.commit()
+
+        runner = app.test_cli_runner()
+
+        self.assertEqual(runner.invoke(args=['check-authors-summary']).exit_code, 1)
+        self.assertEqual(runner.invoke(args=['check-authors-summary', '--fix']).exit_code, 0)
+        self.assertEqual(runner.invoke(args=['check-authors-summary']).exit_code, 0)
+
+    # Search books and authors by word prefixes
+    def test_search(self):
+        self.client.post("/books", json={'title': 'Pan Tadeusz', 'authors': ['Adam Mickiewicz']})
+        self.client.post("/books", json={'title': 'Lalka', 'authors': ['Boleslaw Prus']})
+
+        found = self.client.get("/search?q=tad").json
+        self.assertEqual(found['books'], [{'id': 1, 'title': 'Pan Tadeusz'}])
+
+        found = self.client.get("/search?q=adam mick&type=authors").json
+        self.assertEqual(found, {'authors': [{'id': 1, 'name': 'Adam Mickiewicz'}]})
+
+    # Search index follows renamed and deleted rows
+    def test_search_follows_writes(self):
+        self.client.post("/books", json={'title': 'Pan Tadeusz'})
+        self.client.put("/books/1", json={'title': 'Dziady'})
+
+        self.assertEqual(self.client.get("/search?q=tadeusz").json['books'], [])
+        self.assertEqual(len(self.client.get("/search?q=dzia").json['books']), 1)
+
+        self.client.delete("/books")
+        self.assertEqual(self.client.get("/search?q=dzia").json['books'], [])
+
+    # Search without a query is rejected
+    def test_search_without_query(self):
+        response = self.client.get("/search")
+        self.assertEqual(response.status_code, 400)
+
+    # Fallback for engines without FTS5 matches word prefixes
+    def test_like_search(self):
+        self.client.post("/clients", json={'first_name': 'Jan', 'last_name': 'Kowalski'})
+        self.client.post("/clients", json={'first_name': 'Janina', 'last_name': 'Nowak'})
+
+        found = [row.id for row in like_search('clients', ['jan'], 10)]
+        self.assertEqual(found, [1, 2])
+        self.assertEqual([row.id for row in like_search('clients', ['jan', 'now'], 10)], [2])
+
+    # Filter books by price, premiere, author and client
+    def test_get_books_filters(self):
+        self.client.post("/books", json={'title': 'Cheap', 'price': 5, 'premiere': '1990-01-01', 'authors': ['Jan Kowalski']})
+        self.client.post("/books", json={'title': 'Pricey', 'price': 50, 'premiere': '2010-01-01', 'client': 'Anna Nowak'})
+        self.client.post("/books", json={'title': 'Middle', 'price': 20, 'premiere': '2000-01-01', 'authors': ['Jan Kowalski']})
+
+        titles = lambda url: [book['title'] for book in self.client.get(url).json]
+
+        self.assertEqual(titles("/books?price_min=10&price_max=30"), ['Middle'])
+        self.assertEqual(titles("/books?premiere_from=1995-01-01"), ['Pricey', 'Middle'])
+        self.assertEqual(titles("/books?premiere_to=2005-01-01&author_id=1"), ['Cheap', 'Middle'])
+        self.assertEqual(titles("/books?client_id=1"), ['Pricey'])
+        self.assertEqual(titles("/books?available=true"), ['Cheap', 'Middle'])
+        self.assertEqual(
+            [book['title'] for book in self.client.get("/books?available=false&limit=5").json['items']], ['Pricey']
+        )
+
+    # Sort books by a column in both directions
+    def test_get_books_sorted(self):
+        for title, price in (('B', 3), ('A', 1), ('C', 2)):
+            self.client.post("/books", json={'title': title + ' book', 'price': price})
+
+        prices = lambda url: [book['price'] for book in self.client.get(url).json]
+
+        self.assertEqual(prices("/books?sort=price"), [1, 2, 3])
+        self.assertEqual(prices("/books?sort=-price"), [3, 2, 1])
+        self.assertEqual(self.client.get("/books?sort=-title").json[0]['title'], 'C book')
+
+    # Reject sorting of a paginated listing and invalid filters
+    def test_get_books_invalid_filters(self):
+        self.assertEqual(self.client.get("/books?sort=price&limit=10").status_code, 400)
+        self.assertEqual(self.client.get("/books?sort=pages").status_code, 400)
+        self.assertEqual(self.client.get("/books?premiere_from=yesterday").status_code, 400)
+
+    # Return only the requested fields of books, the id always comes along
+    def test_get_books_fields(self):
+        self.client.post("/books", json={'title': 'Dune', 'price': 10, 'authors': ['Frank Herbert']})
+
+        self.assertEqual(self.client.get("/books?fields=title").json, [{'id': 1, 'title': 'Dune'}])
+        self.assertEqual(
+            self.client.get("/books?fields=title,authors&limit=1").json['items'],
+            [{'id': 1, 'title': 'Dune', 'authors': [{'id': 1, 'name': 'Frank Herbert'}]}]
+        )
+        self.assertEqual(self.client.get("/books?fields=pages").status_code, 400)
+
+    # Skip reading the books of authors and clients when they are not requested
+    def test_get_authors_fields_skip_books(self):
+        for book in list_of_books(5):
+            self.client.post("/books", json=book)
+
+        for url in ("/authors", "/clients"):
+            response, statements = self.sql_statements('get', url + "?fields=first_name")
+            _, all_statements = self.sql_statements('get', url)
+
+            self.assertEqual(set(response.json[0]), {'id', 'first_name'})
+            self.assertLess(len(statements), len(all_statements))
+            self.assertFalse(any('book' in statement for statement in statements))
+
+    # Cut the requested fields out of a cached payload with its own ETag
+    def test_get_author_by_id_fields(self):
+        self.client.post("/authors", json={'first_name': 'Frank', 'last_name': 'Herbert', 'books': ['Dune']})
+        full = self.client.get("/authors/1")
+        response = self.client.get("/authors/1?fields=last_name,books")
+
+        self.assertEqual(response.json, {'id': 1, 'last_name': 'Herbert', 'books': [{'id': 1, 'title': 'Dune'}]})
+        self.assertNotEqual(response.headers['ETag'], full.headers['ETag'])
+        self.assertEqual(self.client.get("/clients/1?fields=books").status_code, 404)
+        self.assertEqual(self.client.get("/books/1?fields=name").status_code, 400)
+
+    # Write requests end with a single commit, however many rows they create
+    def test_single_commit_per_request(self):
+        commits = list()
+        listener = lambda session: commits.append(session)
+        event.listen(database.session, 'after_commit', listener)
+
+        self.client.post("/books", json={'title': 'Dune', 'authors': ['A One', 'B Two', 'C Three'], 'client': 'D Four'})
+        self.client.post("/authors", json={'first_name': 'E', 'last_name': 'Five', 'books': ['Xanadu', 'Ymir']})
+        self.client.put("/clients/1", json={'books': ['Zorba', 'Dune']})
+        self.client.delete("/authors/1")
+        event.remove(database.session, 'after_commit', listener)
+
+        self.assertEqual(len(commits), 4)
+        self.assertEqual(self.client.get("/books/1").json['client_id'], 1)
+        self.assertEqual(len(self.client.get("/authors").json), 3)
+
+    # Resolve a known author name without querying the author table
+    def test_name_index_skips_lookup(self):
+        self.client.post("/books", json={'title': 'Dune', 'authors': ['Frank Herbert'], 'client': 'Anna Nowak'})
+        response, statements = self.sql_statements(
+            'post', "/books", json={'title': 'Dune Messiah', 'authors': ['Frank Herbert'], 'client': 'Anna Nowak'}
+        )
+
+        self.assertEqual(response.status_code, 201)
+        self.assertFalse([sql for sql in statements if 'FROM author' in sql or 'FROM client' in sql])
+        self.assertEqual(self.client.get("/authors/1").json['books'], [{'id': 1, 'title': 'Dune'}, {'id': 2, 'title': 'Dune Messiah'}])
+
+    # Renamed and deleted names are not resolved to their old rows
+    def test_name_index_invalidated(self):
+        self.client.post("/books", json={'title': 'Dune', 'authors': ['Frank Herbert', 'Brian Herbert']})
+        self.client.put("/authors/1", json={'first_name': 'Franklin'})
+        self.client.delete("/authors/2")
+        self.client.post("/books", json={'title': 'Dune Messiah', 'authors': ['Frank Herbert', 'Brian Herbert']})
+
+        authors = self.client.get("/books/2").json['authors']
+
+        self.assertEqual([author['name'] for author in authors], ['Frank Herbert', 'Brian Herbert'])
+        self.assertNotIn(1, [author['id'] for author in authors])
+        self.assertEqual(self.client.get(f"/authors/{authors[1]['id']}").json['books'], [{'id': 2, 'title': 'Dune Messiah'}])
+        self.assertEqual(self.client.get("/authors/1").json['first_name'], 'Franklin')
+
+    # A name renamed by another process is not resolved from this index
+    def test_name_index_renamed_elsewhere(self):
+        self.client.post("/books", json={'title': 'Dune', 'authors': ['Frank Herbert']})
+
+        # Written as another worker would, only the names version tells of it
+        database.session.execute(Author.__table__.update().values(first_name='Franklin'))
+        bump_version(database.session, NAMES, utcnow())
+        database.session.commit()
+        self.client.post("/books", json={'title': 'Dune Messiah', 'authors': ['Frank Herbert']})
+
+        self.assertEqual(self.client.get("/books/2").json['authors'][0]['name'], 'Frank Herbert')
+        self.assertEqual(self.client.get("/authors/1").json['books'], [{'id': 1, 'title': 'Dune'}])
+
+    # Names stored meanwhile are skipped by a bulk insert instead of failing
+    def test_create_all_skips_stored_names(self):
+        self.client.post("/authors", json={'first_name': 'Frank', 'last_name': 'Herbert'})
+
+        names.create_all(Author, [
+            {'first_name': 'Frank', 'last_name': 'Herbert'}, {'first_name': 'Brian', 'last_name': 'Herbert'}
+        ])
+        database.session.commit()
+
+        self.assertEqual(sorted(author.first_name for author in Author.query), ['Brian', 'Frank'])
+
+    # Unique names: a second insert reads the existing row, a rename to a taken name is refused
+    def test_unique_names(self):
+        first = names.create(Author, first_name='Frank', last_name='Herbert')
+        second = names.create(Author, first_name='Frank', last_name='Herbert')
+        database.session.commit()
+        self.client.post("/authors", json={'first_name': 'Brian', 'last_name': 'Herbert'})
+
+        self.assertEqual(first.id, second.id)
+        self.assertEqual(Author.query.count(), 2)
+        self.assertEqual(self.client.put("/authors/2", json={'first_name': 'Frank'}).status_code, 409)
+        self.assertEqual(self.client.put("/authors/2", json={'birth': '1947-12-30'}).status_code, 200)
+
+    # Serve the app with gunicorn, options fall back to the configuration
+    @unittest.skipUnless(importlib.util.find_spec('gunicorn'), "gunicorn is not installed")
+    def test_serve_options(self):
+        from gunicorn.app.base import BaseApplication
+        from library.__main__ import main
+
+        servers = list()
+
+        with patch.object(BaseApplication, 'run', lambda server: servers.append(server)):
+            result = CliRunner().invoke(main, ['serve', '--workers', '3', '--bind', '127.0.0.1:8001'])
+
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertEqual(servers[0].cfg.workers, 3)
+        self.assertEqual(servers[0].cfg.threads, app.config['SERVER_THREADS'])
+        self.assertEqual(servers[0].cfg.bind, ['127.0.0.1:8001'])
+        self.assertIs(servers[0].load(), app)
+
+    # New SQLite connections run the configured PRAGMAs
+    def test_sqlite_pragmas(self):
+        with database.engine.connect() as connection:
+            pragma = lambda name: connection.exec_driver_sql(f"PRAGMA {name}").scalar()
+
+            self.assertEqual(pragma('journal_mode'), 'wal')
+            self.assertEqual(pragma('synchronous'), 1)
+            self.assertEqual(pragma('busy_timeout'), app.config['SQLITE_PRAGMAS']['busy_timeout'])
+
+    # Concurrent writers of the same names wait for each other instead of failing
+    def test_concurrent_writes(self):
+        def post(index):
+            with app.test_client() as client:
+                return client.post("/books", json={
+                    'title': f"Book {index}", 'authors': ['Frank Herbert', 'Brian Herbert'], 'client': 'Anna Nowak'
+                }).status_code
+
+        with ThreadPoolExecutor(8) as executor:
+            statuses = list(executor.map(post, range(32)))
+
+        # The pooled connections of the threads keep a schema cache of this test
+        database.engine.dispose()
+
+        self.assertEqual(statuses, [201] * 32)
+        self.assertEqual(len(self.client.get("/books").json), 32)
+        self.assertEqual([len(author['books']) for author in self.client.get("/authors").json], [32, 32])
+        self.assertEqual(len(self.client.get("/clients").json[0]['books']), 32)
+
+    # GET requests read from the replica, writes and their reads use the primary
+    def test_read_replica(self):
+        self.client.post("/books", json={'title': 'Dune', 'authors': ['Frank Herbert']})
+
+        with tempfile.TemporaryDirectory() as directory:
+            replica = create_engine('sqlite:///' + os.path.join(directory, 'replica.db'))
+            database.metadata.create_all(replica)
+
+            with replica.begin() as connection:
+                connection.execute(database.metadata.tables['book'].insert(), {'id': 1, 'title': 'Replica'})
+
+            with patch.dict(database.engines, {'replica': replica}):
+                titles = [book['title'] for book in self.client.get("/books").json]
+                modified = self.client.put("/books/1", json={'price': 5}).json
+                posted = self.client.post("/books", json={'title': 'Children of Dune'}).status_code
+
+            replica.dispose()
+
+        self.assertEqual(titles, ['Replica'])
+        self.assertEqual(modified, {'modified': 'Dune'})
+        self.assertEqual(posted, 201)
+        self.assertEqual(
+            [(book['title'], book['price']) for book in self.client.get("/books").json],
+            [('Dune', 5), ('Children of Dune', None)]
+        )
+
+    # Read endpoints stay within their query budgets however many rows they return
+    def test_query_budgets(self):
+        for book in list_of_books(10):
+            self.client.post("/books", json=book)
+
+        self.assertQueryBudget(2, 'get', "/books")
+        self.assertQueryBudget(2, 'get', "/books?author_id=1&sort=-price")
+        self.assertQueryBudget(3, 'get', "/authors")
+        self.assertQueryBudget(3, 'get', "/clients?limit=5")
+        self.assertQueryBudget(2, 'get', "/books/1")
+        self.assertQueryBudget(3, 'get', "/authors/1")
+        self.assertQueryBudget(1, 'get', "/authors/1")
+
+    # Report SQL statements and timings in Server-Timing headers
+    def test_server_timing(self):
+        self.client.post("/books", json={'title': 'Dune', 'authors': ['Frank Herbert']})
+        response, statements = self.sql_statements('get', "/authors")
+        timing = dict(part.strip().split(';', 1) for part in response.headers['Server-Timing'].split(','))
+
+        self.assertEqual(set(timing), {'db', 'serialize', 'total'})
+        self.assertIn(f'desc="{len(statements)} queries"', timing['db'])
+
+    # Export per endpoint totals in the Prometheus text format
+    def test_metrics(self):
+        self.client.post("/books", json={'title': 'Dune'})
+        self.client.get("/books/1")
+        self.client.get("/books/1")
+        body = self.client.get("/metrics").get_data(as_text=True)
+
+        self.assertIn('library_requests_total{method="GET",endpoint="/books/<int:id>"} 2', body)
+        self.assertIn('library_requests_total{method="POST",endpoint="/books"} 1', body)
+        self.assertIn('# TYPE library_sql_statements_total counter', body)
+
+    # Benchmark datasets depend on their size and seed only
+    def test_benchmark_dataset(self):
+        from benchmarks.dataset import rows
+
+        first, second, other = rows(50, 1), rows(50, 1), rows(50, 2)
+        without_time = lambda tables: {name: [{**row, 'updated_at': None} for row in table] for name, table in tables.items()}
+
+        self.assertEqual(without_time(first), without_time(second))
+        self.assertNotEqual(without_time(first)['book'], without_time(other)['book'])
+        self.assertEqual([len(first[name]) for name in ('book', 'author', 'client')], [50, 25, 5])
+        self.assertEqual(len({book['title'] for book in first['book']}), 50)
+
+    # Dates are read and written as ISO 8601, in JSON and NDJSON alike
+    def test_iso_dates(self):
+        self.client.post("/authors", json={'first_name': 'Frank', 'last_name': 'Herbert', 'birth': '1920-10-08', 'books': ['Dune']})
+        self.client.put("/books/1", json={'premiere': '1965-08-01'})
+        self.client.put("/authors/1", json={'death': '1986-02-11'})
+
+        author = self.client.get("/authors/1").json
+        line = json.loads(self.client.get("/books?format=ndjson").get_data(as_text=True))
+
+        self.assertEqual((author['birth'], author['death']), ('1920-10-08', '1986-02-11'))
+        self.assertEqual(line['premiere'], '1965-08-01')
+        self.assertEqual(self.client.get("/books?premiere_from=1965-08-01").json[0]['premiere'], '1965-08-01')
+
+    # An invalid date is stored as empty, as before
+    def test_invalid_date(self):
+        self.client.post("/authors", json={'first_name': 'Frank', 'last_name': 'Herbert', 'birth': '08.10.1920'})
+
+        self.assertIsNone(self.client.get("/authors/1").json['birth'])
+
+    # Rows are written straight to JSON text, the same text the JSON provider writes
+    def test_row_encoders(self):
+        fields = ('id', 'title', 'premiere', 'price', 'client_id')
+        row = (1, 'Za\u017c\u00f3\u0142\u0107 "q"', date(2001, 2, 3), 3.5, None)
+
+        self.assertEqual(
+            row_encoder('books', fields)(row),
+            app.json.dumps(dict(zip(fields, row)), separators=(',', ':'))
+        )
+        self.assertEqual(
+            json.loads(row_encoder('books', ('id', 'authors'))((1, '[{"name": "A B", "id": 2}]'))),
+            {'id': 1, 'authors': [{'name': 'A B', 'id': 2}]}
+        )
+
+    # The authors summary is embedded as compact JSON with sorted keys, like the rest of a payload
+    def test_authors_summary_compact(self):
+        self.client.post("/books", json={'title': 'Dune', 'authors': ['Frank Herbert']})
+        self.client.post("/books", json={'title': 'Solo'})
+
+        self.assertIn('"authors":[{"id":1,"name":"Frank Herbert"}]', self.client.get("/books/1").get_data(as_text=True))
+        self.assertIn('"authors":[]', self.client.get("/books/2").get_data(as_text=True))
+
+    # Whole collections are read as tuples in batches, no book is loaded as an object
+    def test_list_books_in_batches(self):
+        for book in list_of_books(5):
+            self.client.post("/books", json=book)
+
+        loaded = list()
+        listener = lambda target, context: loaded.append(target)
+        event.listen(Book, 'load', listener)
+
+        with patch.dict(app.config, {'STREAM_BATCH_SIZE': 2}):
+            response = self.client.get("/books")
+
+        event.remove(Book, 'load', listener)
+
+        self.assertEqual([book['id'] for book in response.json], [1, 2, 3, 4, 5])
+        self.assertEqual(loaded, [])
+
+    # The async application answers reads as the Flask one does and hands writes over to it
+    @unittest.skipUnless(all(importlib.util.find_spec(name) for name in ASYNC_PACKAGES), "async packages are not installed")
+    def test_async_application(self):
+        from starlette.testclient import TestClient
+        from library.asgi import create_application
+
+        for book in list_of_books(5):
+            self.client.post("/books", json=book)
+
+        with TestClient(create_application(app)) as client:
+            for url in ("/books", "/books?limit=2&fields=title", "/books?format=ndjson", "/books?ids=2,1,9", "/authors/1", "/clients?limit=1", "/books/99", "/books?fields=pages"):
+                response, expected = client.get(url), self.client.get(url)
+
+                self.assertEqual((response.status_code, response.content), (expected.status_code, expected.data), url)
+                self.assertEqual(response.headers.get('ETag'), expected.headers.get('ETag'), url)
+                self.assertEqual(response.headers.get('Vary'), expected.headers.get('Vary'), url)
+
+            self.assertEqual(client.post("/books", json={'title': 'Async write'}).status_code, 201)
+            self.assertEqual(len(client.get("/books").json()), 6)
+            self.assertEqual(client.get("/books/6", headers={'If-None-Match': self.client.get("/books/6").headers['ETag']}).status_code, 304)
+
+    # Serve the async application with uvicorn workers
+    @unittest.skipUnless(all(importlib.util.find_spec(name) for name in ASYNC_PACKAGES + ('uvicorn',)), "async packages are not installed")
+    def test_serve_async_options(self):
+        from library.__main__ import main
+
+        with patch('uvicorn.run') as run:
+            result = CliRunner().invoke(main, ['serve-async', '--workers', '2', '--bind', '127.0.0.1:8002'])
+
+        self.assertEqual(result.exit_code, 0, result.output)
+        run.assert_called_once_with('library.asgi:create_application', factory=True, host='127.0.0.1', port=8002, workers=2)
+
+    # Get many records by id at once, in the requested order, with the missing ids listed
+    def test_get_by_ids(self):
+        for book in list_of_books(5):
+            self.client.post("/books", json=book)
+
+        response = self.assertQueryBudget(2, 'get', "/books?ids=3,1,99,3")
+
+        self.assertEqual([book['id'] for book in response.json['items']], [3, 1])
+        self.assertEqual(response.json['items'][0], self.client.get("/books/3").json)
+        self.assertEqual(response.json['missing'], [99])
+
+        response = self.assertQueryBudget(3, 'get', "/authors?ids=1,2&fields=books")
+
+        self.assertEqual([set(author) for author in response.json['items']], [{'id', 'books'}] * 2)
+
+    # Ids must be positive integers and are not combined with filters or pages
+    def test_get_by_ids_invalid(self):
+        self.assertEqual(self.client.get("/books?ids=1,two").status_code, 400)
+        self.assertEqual(self.client.get("/clients?ids=0").status_code, 400)
+        self.assertEqual(self.client.get("/books?ids=1&price_min=5").status_code, 400)
+        self.assertEqual(self.client.get("/authors?ids=1&limit=5").status_code, 400)
+
+    # PATCH adds and removes single links, the other links are not rewritten
+    def test_patch_book_links(self):
+        self.client.post("/books", json={'title': 'Dune', 'authors': ['Frank Herbert', 'Brian Herbert', 'Kevin Anderson']})
+        response, statements = self.sql_statements('patch', "/books/1", json={
+            'authors': {'add': ['New Author', 'Frank Herbert'], 'remove': ['Brian Herbert']}
+        })
+        writes = [statement for statement in statements if 'books_authors' in statement and not statement.startswith('SELECT')]
+
+        self.assertEqual(response.json, {'modified': 'Dune', 'changed': ['authors']})
+        self.assertEqual(len(writes), 2)
+        self.assertEqual(
+            [author['name'] for author in self.client.get("/books/1").json['authors']],
+            ['Frank Herbert', 'Kevin Anderson', 'New Author']
+        )
+
+    # A PATCH that changes nothing writes nothing and keeps the ETag
+    def test_patch_unchanged(self):
+        self.client.post("/books", json={'title': 'Dune', 'price': 10, 'authors': ['Frank Herbert']})
+        etag = self.client.get("/books/1").headers['ETag']
+        response, statements = self.sql_statements('patch', "/books/1", json={
+            'title': 'Dune', 'price': 10, 'authors': {'add': ['Frank Herbert']}
+        })
+
+        self.assertEqual(response.json['changed'], [])
+        self.assertTrue(all(statement.startswith('SELECT') for statement in statements), statements)
+        self.assertEqual(self.client.get("/books/1").headers['ETag'], etag)
+
+    # PATCH renames authors and lends books to clients, the payloads follow
+    def test_patch_author_and_client(self):
+        self.client.post("/books", json={'title': 'Dune', 'authors': ['Frank Herbert'], 'client': 'Jan Kowalski'})
+
+        response = self.client.patch("/authors/1", json={'last_name': 'Herbertt', 'books': {'add': ['Dune Messiah']}})
+
+        self.assertEqual(response.json['changed'], ['last_name', 'books'])
+        self.assertEqual(self.client.get("/books/1").json['authors'], [{'id': 1, 'name': 'Frank Herbertt'}])
+
+        response = self.client.patch("/clients/1", json={'books': {'add': ['Dune Messiah'], 'remove': ['Dune']}})
+
+        self.assertEqual(response.json['changed'], ['books'])
+        self.assertEqual(self.client.get("/clients/1").json['books'], [{'id': 2, 'title': 'Dune Messiah'}])
+        self.assertIsNone(self.client.get("/books/1").json['client_id'])
+        self.assertEqual(self.client.patch("/books/1", json={'authors': {'add': ['Single']}}).status_code, 400)
+        self.assertEqual(self.client.patch("/books/1", json={'authors': ['Frank Herbertt']}).status_code, 400)
+        self.assertEqual(self.client.patch("/clients/9", json={}).status_code, 404)
+
 #================================================================
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file